@@ -1,9 +1,25 @@
-from agent.enhanced_genesis_agent import EnhancedGenesisAgent
-from agent.llm_adapter import LLMAdapter
-from agent.enhanced_context_manager import EnhancedContextManager
+from importlib import import_module
 
-# Aliases for backward compatibility
-GenesisAgent = EnhancedGenesisAgent
-ContextManager = EnhancedContextManager
+# Submodules are imported on first attribute access (PEP 562) so that importing
+# e.g. LLMAdapter does not pull in the tool registry, MCP client and redis
+_LAZY_ATTRS = {
+    'EnhancedGenesisAgent': ('agent.enhanced_genesis_agent', 'EnhancedGenesisAgent'),
+    'LLMAdapter': ('agent.llm_adapter', 'LLMAdapter'),
+    'EnhancedContextManager': ('agent.enhanced_context_manager', 'EnhancedContextManager'),
+    # Aliases for backward compatibility
+    'GenesisAgent': ('agent.enhanced_genesis_agent', 'EnhancedGenesisAgent'),
+    'ContextManager': ('agent.enhanced_context_manager', 'EnhancedContextManager'),
+}
+
+def __getattr__(name):
+    if name in _LAZY_ATTRS:
+        module_name, attr = _LAZY_ATTRS[name]
+        value = getattr(import_module(module_name), attr)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY_ATTRS))
 
 __all__ = ['EnhancedGenesisAgent', 'LLMAdapter', 'EnhancedContextManager']
\ No newline at end of file
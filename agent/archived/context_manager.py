@@ -1,30 +1,44 @@
-from typing import Dict, Any, List
-import json
-from datetime import datetime
-import redis
+from typing import Dict, Any, List, Optional
+import msgpack
 import hashlib
 import logging
 
+from agent.time_utils import now_iso
+
 logger = logging.getLogger(__name__)
 
+MAX_MESSAGES = 50
+CONTEXT_TTL = 3600 * 24  # 24 hour TTL
+
 class ContextManager:
     """Manages conversation context and history."""
     
     def __init__(self, redis_url: str = None):
         if redis_url:
-            self.redis_client = redis.from_url(redis_url)
+            # Imported here so in-memory users never load the redis client
+            import redis.asyncio as redis
+            
+            # Created once and reused so every call shares the connection pool
+            self.redis_client = redis.Redis.from_url(redis_url)
         else:
             # Use in-memory storage for development
             self.memory_store = {}
     
-    def get_context(self, conversation_id: str) -> Dict[str, Any]:
+    async def get_context(self, conversation_id: str) -> Dict[str, Any]:
         """Retrieve context for a conversation."""
         context = None
         
         if hasattr(self, 'redis_client'):
-            data = self.redis_client.get(f"context:{conversation_id}")
-            if data:
-                context = json.loads(data)
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.lrange(f"messages:{conversation_id}", 0, -1)
+                pipe.hgetall(f"meta:{conversation_id}")
+                messages, metadata = await pipe.execute()
+            if messages or metadata:
+                context = {
+                    "conversation_id": conversation_id,
+                    "messages": [msgpack.unpackb(m, raw=False) for m in messages],
+                    "metadata": {k.decode(): v.decode() for k, v in metadata.items()}
+                }
         else:
             context = self.memory_store.get(conversation_id)
         
@@ -33,60 +47,76 @@ class ContextManager:
             return context
         
         # Return empty context if not found
+        now = now_iso()
         return {
             "conversation_id": conversation_id,
             "messages": [],
             "metadata": {
-                "created_at": datetime.now().isoformat(),
-                "last_updated": datetime.now().isoformat()
+                "created_at": now,
+                "last_updated": now
             }
         }
     
-    def update(self, conversation_id: str, query: str, results: Dict[str, Any]):
-        """Update conversation context with new interaction."""
-        context = self.get_context(conversation_id)
+    async def update(self, conversation_id: str, query: str, results: Dict[str, Any], existing_context: Optional[Dict[str, Any]] = None):
+        """Update conversation context with new interaction.
         
-        # Add new message
-        context["messages"].append({
-            "timestamp": datetime.now().isoformat(),
+        Callers that already loaded the context pass it as existing_context to skip a second read.
+        """
+        now = now_iso()
+        message = {
+            "timestamp": now,
             "query": query,
             "results": results,
             "hash": self._hash_message(query)
-        })
+        }
+        
+        if hasattr(self, 'redis_client'):
+            # Only the new message is sent; Redis trims the history server-side
+            messages_key = f"messages:{conversation_id}"
+            meta_key = f"meta:{conversation_id}"
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.rpush(messages_key, msgpack.packb(message, use_bin_type=True))
+                pipe.ltrim(messages_key, -MAX_MESSAGES, -1)
+                pipe.hsetnx(meta_key, "created_at", now)
+                pipe.hset(meta_key, "last_updated", now)
+                pipe.expire(messages_key, CONTEXT_TTL)
+                pipe.expire(meta_key, CONTEXT_TTL)
+                await pipe.execute()
+            return
+        
+        context = existing_context if existing_context is not None else await self.get_context(conversation_id)
+        
+        # Add new message
+        context["messages"].append(message)
         
         # Keep only last 50 messages to prevent context overflow
-        if len(context["messages"]) > 50:
-            context["messages"] = context["messages"][-50:]
+        if len(context["messages"]) > MAX_MESSAGES:
+            context["messages"] = context["messages"][-MAX_MESSAGES:]
         
         # Update metadata
-        context["metadata"]["last_updated"] = datetime.now().isoformat()
+        context["metadata"]["last_updated"] = now
         
-        # Save context
-        if hasattr(self, 'redis_client'):
-            self.redis_client.setex(
-                f"context:{conversation_id}",
-                3600 * 24,  # 24 hour TTL
-                json.dumps(context)
-            )
-        else:
-            self.memory_store[conversation_id] = context
+        self.memory_store[conversation_id] = context
     
-    def get_relevant_context(self, conversation_id: str, query: str, max_messages: int = 10) -> List[Dict[str, Any]]:
+    async def get_relevant_context(self, conversation_id: str, query: str, max_messages: int = 10) -> List[Dict[str, Any]]:
         """Get the most relevant context for a query."""
-        context = self.get_context(conversation_id)
-        messages = context.get("messages", [])
-        
         # For now, return the most recent messages
         # In the future, this could use semantic similarity
+        if hasattr(self, 'redis_client'):
+            messages = await self.redis_client.lrange(f"messages:{conversation_id}", -max_messages, -1)
+            return [msgpack.unpackb(m, raw=False) for m in messages]
+        
+        context = await self.get_context(conversation_id)
+        messages = context.get("messages", [])
         return messages[-max_messages:]
     
-    def clear_context(self, conversation_id: str):
+    async def clear_context(self, conversation_id: str):
         """Clear context for a conversation."""
         if hasattr(self, 'redis_client'):
-            self.redis_client.delete(f"context:{conversation_id}")
+            await self.redis_client.delete(f"messages:{conversation_id}", f"meta:{conversation_id}")
         else:
             self.memory_store.pop(conversation_id, None)
     
     def _hash_message(self, message: str) -> str:
         """Create a hash of a message for deduplication."""
-        return hashlib.sha256(message.encode()).hexdigest()[:16]
\ No newline at end of file
+        return hashlib.blake2b(message.encode(), digest_size=8).hexdigest()
\ No newline at end of file
@@ -1,48 +1,221 @@
 import asyncio
-from typing import List, Dict, Any, Optional
-import json
-from datetime import datetime
+from collections import deque
+from typing import List, Dict, Any, Optional, Union
+from functools import lru_cache, partial
 import logging
+import re
 
-from agent.llm_adapter import LLMAdapter
+import orjson
+from pydantic import BaseModel, Field, TypeAdapter
+
+from agent.llm_adapter import LLMAdapter, BatchingLLMAdapter, CACHEABLE_TEMPERATURE, JSON_SCHEMAS
+from agent.client_context import ClientContext
+from agent.stream_frames import frame_stream
 from agent.enhanced_context_manager import EnhancedContextManager
+from agent.time_utils import now_iso
 from tools.registry.enhanced_dynamic_loader import EnhancedDynamicToolRegistry
-from tools.mcp_client import MCPClient
-from tools.registry import TOOL_REGISTRY, get_tool_descriptions_for_prompt
+from tools.registry import TOOL_REGISTRY, get_tool_descriptions_for_prompt, get_registry_version
 
 logger = logging.getLogger(__name__)
 
+# Prompt templates are filled with str.format_map; literal JSON braces are doubled.
+# Each LLM call sends a static system prompt followed by a short user message holding the query
+# and context, so requests share the longest possible prefix for provider prompt caching.
+_SYSTEM_PROMPT_TEMPLATE = """
+You are Genesis Assistant, a financial analysis expert. You help users with stock market analysis,
+technical indicators, and financial data.
+
+AVAILABLE TOOLS:
+{tool_descriptions}
+
+INSTRUCTIONS:
+1. Analyze user queries carefully and match them to available tools
+2. Use tools ONLY when they clearly match the user's request
+3. For ambiguous requests, consider the context to infer intent
+4. If no tools match, explain your capabilities instead
+
+For each user query, determine:
+1. What tools (if any) should be used to answer this query
+2. What parameters each tool needs
+3. Your reasoning for the selection
+4. The execution plan: the ordered tool calls, and which earlier steps each one depends on
+
+Return a JSON object with:
+{{
+    "tools_to_use": [
+        {{
+            "tool_key": "tool_name_from_registry",
+            "tool_id": "actual_tool_id",
+            "parameters": {{}},
+            "reason": "why this tool is needed"
+        }}
+    ],
+    "reasoning": "overall reasoning for tool selection",
+    "entities": {{"symbols": [], "time_period": null, "indicators": []}},
+    "plan": [
+        {{
+            "tool_id": "actual_tool_id",
+            "parameters": {{}},
+            "depends_on": []
+        }}
+    ]
+}}
+
+Each "depends_on" entry is the index of an earlier step in "plan". A parameter value of
+"$step_<index>" is replaced with the result of that step before the tool is called.
+
+If no tools are needed, set tools_to_use and plan to empty arrays.
+"""
+
+_PLAN_AND_SELECT_TEMPLATE = """CURRENT CONTEXT:
+- Last analyzed entity: {last_entity}
+- Previous tool used: {last_tool}
+- Recent entities: {recent_entities}
+
+User Query: {query}"""
+
+_EXECUTION_PLAN_SYSTEM_PROMPT = """
+Create an execution plan for the user's query using the available tools.
+
+Return a JSON object with a "steps" array, each step with:
+- tool_id: ID of the tool to use
+- parameters: parameters to pass to the tool
+- depends_on: array of step indices this step depends on
+"""
+
+_EXECUTION_PLAN_TEMPLATE = """Available Tools: {available_tools_json}
+Context: {context}
+
+Query: {query}"""
+
+_FORMAT_RESPONSE_SYSTEM_PROMPT = """
+Format the analysis results you are given into a clear, concise response.
+
+Guidelines:
+- Start with a summary of key findings
+- Use bullet points for important metrics
+- Include specific numbers and percentages
+- Provide actionable insights
+- End with a recommendation if applicable
+"""
+
+_FORMAT_PROMPT_SYSTEM_PROMPT = """
+Format the analysis results you are given into a clear, professional response.
+
+Guidelines:
+- Be concise and focus on the key findings
+- Use specific numbers and data points
+- Format numbers appropriately (e.g., $45.23, +2.5%)
+- Provide actionable insights where relevant
+"""
+
+_RESULTS_TEMPLATE = "Results: {results}"
+
+# Queries asking for explanation or judgement get an LLM-written response even when every tool
+# result is already formatted
+_SYNTHESIS_QUERY = re.compile(r"\b(?:explain|why|how|analy[sz]e|analysis|compare|should|recommend|summar\w*|outlook)\b", re.I)
+
+# Conversation topic recorded for a turn, by the prefix of a tool key it used; first match wins
+_TOPIC_BY_PREFIX = (
+    ("technical", "technical_analysis"),
+    ("fundamental", "fundamental_analysis"),
+)
+
+# A completed "tool_id" field in a partially streamed plan response
+_TOOL_ID_FIELD = re.compile(r'"tool_id"\s*:\s*"([^"\\]+)"')
+
+# Typed views of the LLM's JSON; responses are parsed and validated in one pydantic-core pass
+class ToolConfig(BaseModel):
+    tool_key: str = ""
+    tool_id: str = ""
+    parameters: Dict[str, Any] = Field(default_factory=dict)
+    reason: str = ""
+
+class PlanStep(BaseModel):
+    tool_id: str
+    parameters: Dict[str, Any] = Field(default_factory=dict)
+    depends_on: List[int] = Field(default_factory=list)
+
+class AnalysisEntities(BaseModel):
+    symbols: List[str] = Field(default_factory=list)
+    time_period: Optional[str] = None
+    indicators: List[str] = Field(default_factory=list)
+
+class AnalysisResult(BaseModel):
+    tools_to_use: List[ToolConfig] = Field(default_factory=list)
+    reasoning: str = ""
+    entities: AnalysisEntities = Field(default_factory=AnalysisEntities)
+    plan: List[PlanStep] = Field(default_factory=list)
+
+class PlanSteps(BaseModel):
+    steps: List[PlanStep]
+
+_ANALYSIS_RESULT = TypeAdapter(AnalysisResult)
+# create_execution_plan asks for {"steps": [...]}, but providers without schema support may return a bare list
+_EXECUTION_PLAN = TypeAdapter(Union[List[PlanStep], PlanSteps])
+
+JSON_SCHEMAS["genesis_analysis"] = {"name": "genesis_analysis", "schema": AnalysisResult.model_json_schema()}
+JSON_SCHEMAS["genesis_execution_plan"] = {"name": "genesis_execution_plan", "schema": PlanSteps.model_json_schema()}
+
+def _prompt_json(obj: Any) -> str:
+    """Serialize data for a prompt as compact JSON; indentation only adds tokens."""
+    return orjson.dumps(obj, default=list, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY).decode()
+
+def _load_json_response(response: str, adapter: TypeAdapter) -> Any:
+    """Parse and validate an LLM JSON response, failing fast on text that cannot be a JSON object or array."""
+    if not response.lstrip().startswith(("{", "[")):
+        raise ValueError(f"LLM response is not JSON: {response[:80]!r}")
+    return adapter.validate_json(response)
+
+async def _run_nosync(fn, *args, **kwargs):
+    """Run a blocking call in the default executor without copying contextvars like asyncio.to_thread."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, partial(fn, *args, **kwargs))
+
+@lru_cache(maxsize=1)
+def _render_system_prompt(registry_version: int) -> str:
+    """Render the system prompt; rebuilt only when the registry version changes."""
+    return _SYSTEM_PROMPT_TEMPLATE.format_map({"tool_descriptions": get_tool_descriptions_for_prompt()})
+
 class GenesisAgent:
     """Main agent class that orchestrates tool loading and execution."""
     
     def __init__(self, llm_provider: str = "openai"):
-        self.llm_adapter = LLMAdapter(provider=llm_provider)
+        # Concurrent planning calls of one conversation share an LLM call through the batching wrapper
+        self.llm_adapter = BatchingLLMAdapter(LLMAdapter(provider=llm_provider))
         self.tool_registry = EnhancedDynamicToolRegistry()
         self.context_manager = EnhancedContextManager()
-        self.mcp_client = MCPClient()
+        self.mcp_client = ClientContext.get_mcp_client()
+        # Tool loads started while a plan is still streaming; referenced here until they finish
+        self._tool_prefetches = set()
     
     async def process_request(self, query: str, conversation_id: str) -> Dict[str, Any]:
         """Process a user request and return a response."""
         try:
             # 1. Load conversation context
-            context = self.context_manager.get_context(conversation_id)
+            context = await _run_nosync(self.context_manager.get_context, conversation_id)
             context['conversation_id'] = conversation_id
             
-            # 2. Analyze query and select tools using the registry
-            analysis = await self.analyze_intent(query, context)
-            required_tools = await self.determine_tools(analysis)
+            # 2. Select tools and build the execution plan in a single LLM call
+            analysis = await self.plan_and_select(query, context)
+            required_tools = self.determine_tools(analysis)
             
             # 3. If tools are needed, load and execute them
             if required_tools:
-                tools = await self.tool_registry.load_tools(required_tools)
-                
-                # 4. Create and execute plan with selected tools
-                plan = await self.create_execution_plan(query, tools, context, analysis)
+                # 4. Execute the plan, only asking for a separate one if it was omitted.
+                # Planning needs tool metadata only, so it overlaps with tool loading;
+                # execute_plan loads the tools of a returned plan itself.
+                plan = analysis.plan
+                if not plan:
+                    _, plan = await asyncio.gather(
+                        self.tool_registry.load_tools(required_tools),
+                        self.create_execution_plan(query, required_tools, context, analysis)
+                    )
                 results = await self.execute_plan(plan)
                 
                 # 5. Update context with execution details
-                self._update_context_from_execution(conversation_id, analysis, results)
-                response = await self.format_response(results)
+                await self._update_context_from_execution(conversation_id, analysis, results, context, query)
+                response = await self.format_response(results, query)
             else:
                 # No tools needed - return a direct response
                 response = "I can help you analyze stocks, view technical indicators, check fundamentals, and compare companies. What would you like to know?"
@@ -52,7 +225,7 @@ class GenesisAgent:
                 "response": response,
                 "metadata": {
                     "tools_used": required_tools,
-                    "execution_time": datetime.now().isoformat()
+                    "execution_time": now_iso()
                 }
             }
         except Exception as e:
@@ -62,139 +235,126 @@ class GenesisAgent:
                 "error": True
             }
     
-    def get_system_prompt(self, context: Dict[str, Any]) -> str:
-        """Generate system prompt with tool registry information."""
-        tool_descriptions = get_tool_descriptions_for_prompt()
-        context_summary = self.context_manager.get_conversation_summary(context.get('conversation_id', ''))
+    def get_system_prompt(self) -> str:
+        """Get the system prompt with tool registry information; identical across requests."""
+        return _render_system_prompt(get_registry_version())
+    
+    async def plan_and_select(self, query: str, context: Dict[str, Any]) -> AnalysisResult:
+        """Select tools and create the execution plan in a single LLM round-trip."""
+        # Summarized from the context loaded for this request rather than read again
+        context_summary = self.context_manager.summarize_context(context)
         
-        return f"""
-You are Genesis Assistant, a financial analysis expert. You help users with stock market analysis,
-technical indicators, and financial data.
-
-AVAILABLE TOOLS:
-{tool_descriptions}
-
-CURRENT CONTEXT:
-- Last analyzed entity: {context_summary.get('last_entity', 'None')}
-- Previous tool used: {context_summary.get('last_tool', 'None')}
-- Recent entities: {context_summary.get('recent_entities', [])}
-
-INSTRUCTIONS:
-1. Analyze user queries carefully and match them to available tools
-2. Use tools ONLY when they clearly match the user's request
-3. For ambiguous requests, consider the context to infer intent
-4. If no tools match, explain your capabilities instead
-"""
-
-    async def analyze_intent(self, query: str, context: Dict[str, Any]) -> Dict[str, Any]:
-        """Analyze query and select appropriate tools using the registry."""
-        prompt = f"""
-{self.get_system_prompt(context)}
-
-User Query: {query}
-
-Analyze this query and determine:
-1. What tools (if any) should be used to answer this query
-2. What parameters each tool needs
-3. Your reasoning for the selection
-
-Return a JSON object with:
-{{
-    "tools_to_use": [
-        {{
-            "tool_key": "tool_name_from_registry",
-            "tool_id": "actual_tool_id",
-            "parameters": {{}},
-            "reason": "why this tool is needed"
-        }}
-    ],
-    "reasoning": "overall reasoning for tool selection",
-    "entities": {{"symbols": [], "time_period": null, "indicators": []}}
-}}
-
-If no tools are needed, set tools_to_use to an empty array.
-        """
+        prompt = _PLAN_AND_SELECT_TEMPLATE.format_map({
+            "last_entity": context_summary.get('last_entity', 'None'),
+            "last_tool": context_summary.get('last_tool', 'None'),
+            "recent_entities": list(context_summary.get('recent_entities', [])),
+            "query": query
+        })
         
-        response = await self.llm_adapter.complete(
+        response = await self._complete_with_tool_prefetch(
             prompt,
+            system=self.get_system_prompt(),
+            prompt_cache_key="genesis-plan",
             response_format="json",
-            temperature=0.3
+            schema="genesis_analysis",
+            purpose="routing"
         )
         
-        return json.loads(response)
+        return _load_json_response(response, _ANALYSIS_RESULT)
+    
+    async def _complete_with_tool_prefetch(self, prompt: str, **kwargs) -> str:
+        """Stream a JSON completion, loading each tool as soon as its tool_id has been generated.
+        
+        This call is deliberately not batched: a combined answer cannot be streamed to each
+        caller, and the prefetch needs the tool ids while they are generated. It is the first
+        LLM call of a request, so there is nothing in the same conversation to batch it with.
+        """
+        kwargs = self.llm_adapter.call_options(kwargs)
+        cached = self.llm_adapter.get_cached(prompt, kwargs)
+        if cached is not None:
+            return cached
+        
+        response = ""
+        scan_from = 0
+        seen = set()
+        async for chunk in self.llm_adapter.complete_stream(prompt, **kwargs):
+            response += chunk
+            for match in _TOOL_ID_FIELD.finditer(response, scan_from):
+                scan_from = match.end()
+                tool_id = match.group(1)
+                if tool_id not in seen:
+                    seen.add(tool_id)
+                    task = asyncio.create_task(self.tool_registry.get_tool(tool_id))
+                    self._tool_prefetches.add(task)
+                    task.add_done_callback(self._finish_tool_prefetch)
+        
+        if kwargs.get("temperature", 0.7) <= CACHEABLE_TEMPERATURE:
+            self.llm_adapter.cache_response(prompt, kwargs, response)
+        return response
+    
+    def _finish_tool_prefetch(self, task: asyncio.Task):
+        # A failed load is only logged; execute_plan loads the tool again and reports the error
+        self._tool_prefetches.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug(f"Tool prefetch failed: {task.exception()}")
     
-    async def determine_tools(self, intent: Dict[str, Any]) -> List[str]:
+    def determine_tools(self, intent: AnalysisResult) -> List[str]:
         """Extract tool IDs from the analysis result."""
-        tools_to_use = intent.get('tools_to_use', [])
         tool_ids = []
+        seen = set()
         
-        for tool_config in tools_to_use:
-            tool_id = tool_config.get('tool_id')
-            if tool_id:
+        # Keep first-seen order but drop repeats so each tool is loaded and described once
+        for tool_config in intent.tools_to_use:
+            tool_id = tool_config.tool_id
+            if tool_id and tool_id not in seen:
+                seen.add(tool_id)
                 tool_ids.append(tool_id)
         
         return tool_ids
     
-    async def create_execution_plan(self, query: str, tools: Dict[str, Any], context: Dict[str, Any], analysis: Dict[str, Any] = None) -> List[Dict[str, Any]]:
-        """Create an execution plan for the tools."""
-        # Extract tool metadata safely
-        tool_metadata = []
-        
-        if isinstance(tools, dict):
-            for tool_id, tool in tools.items():
-                if hasattr(tool, 'metadata'):
-                    tool_metadata.append(tool.metadata)
-                else:
-                    # Fallback: use the tool_id as minimal metadata
-                    tool_metadata.append({"tool_id": tool_id, "description": f"Tool: {tool_id}"})
-        
-        prompt = f"""
-        Create an execution plan for the following query using the available tools:
-        
-        Query: {query}
-        Available Tools: {json.dumps(tool_metadata, indent=2)}
-        Context: {json.dumps(context, indent=2)}
-        
-        Return a JSON array of steps, each with:
-        - tool_id: ID of the tool to use
-        - parameters: parameters to pass to the tool
-        - depends_on: array of step indices this step depends on
-        """
+    async def create_execution_plan(self, query: str, tool_ids: List[str], context: Dict[str, Any], analysis: Optional[AnalysisResult] = None) -> List[PlanStep]:
+        """Create an execution plan for the tools when plan_and_select did not return one."""
+        available_tools_json = self.tool_registry.get_serialized_metadata(tuple(sorted(tool_ids)))
+        
+        prompt = _EXECUTION_PLAN_TEMPLATE.format_map({
+            "query": query,
+            "available_tools_json": available_tools_json,
+            "context": _prompt_json(context)
+        })
         
         response = await self.llm_adapter.complete(
             prompt,
+            system=_EXECUTION_PLAN_SYSTEM_PROMPT,
+            prompt_cache_key="genesis-execution-plan",
             response_format="json",
-            temperature=0.2
+            schema="genesis_execution_plan",
+            purpose="routing",
+            batch_key=context['conversation_id']
         )
         
-        return json.loads(response)
+        plan = _load_json_response(response, _EXECUTION_PLAN)
+        return plan.steps if isinstance(plan, PlanSteps) else plan
     
-    async def execute_plan(self, plan: List[Dict[str, Any]]) -> Dict[str, Any]:
+    async def execute_plan(self, plan_steps: List[PlanStep]) -> Dict[str, Any]:
         """Execute the plan and collect results."""
         results = {}
         
-        # Handle both plan formats: direct list or dict with 'steps' key
-        if isinstance(plan, dict) and 'steps' in plan:
-            plan_steps = plan['steps']
-        elif isinstance(plan, list):
-            plan_steps = plan
-        else:
-            logger.error(f"Invalid plan format: {type(plan)}")
-            return {"error": "Invalid plan format"}
-        
         # Group steps by dependency level
-        dependency_levels = self._group_by_dependencies(plan_steps)
+        try:
+            dependency_levels = self._group_by_dependencies(plan_steps)
+        except ValueError as e:
+            logger.error(f"Invalid plan: {e}")
+            return {"error": str(e)}
+        
+        # Load every tool the plan uses concurrently, rather than level by level as steps start
+        tools = await self.tool_registry.load_tools(list(dict.fromkeys(step.tool_id for step in plan_steps)))
         
         # Execute each level in parallel
         for level in dependency_levels:
-            level_tasks = []
-            for step_idx in level:
-                step = plan_steps[step_idx]
-                task = self._execute_step(step, results)
-                level_tasks.append(task)
+            level_steps = [plan_steps[step_idx] for step_idx in level]
             
             # Wait for all tasks in this level to complete
-            level_results = await asyncio.gather(*level_tasks)
+            level_results = await self._execute_level(level_steps, results, tools)
             
             # Store results
             for idx, result in zip(level, level_results):
@@ -202,46 +362,93 @@ If no tools are needed, set tools_to_use to an empty array.
         
         return results
     
-    async def _execute_step(self, step: Dict[str, Any], previous_results: Dict[str, Any]) -> Dict[str, Any]:
+    async def _execute_level(self, steps: List[PlanStep], previous_results: Dict[str, Any], tools: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Run independent steps concurrently, cancelling the rest as soon as one fails."""
+        if hasattr(asyncio, "TaskGroup"):
+            try:
+                async with asyncio.TaskGroup() as tg:
+                    tasks = [tg.create_task(self._execute_step(step, previous_results, tools)) for step in steps]
+            except ExceptionGroup as eg:
+                # Surface the original tool error rather than the group wrapper
+                raise eg.exceptions[0]
+            return [task.result() for task in tasks]
+        
+        # Python < 3.11: same semantics with gather and explicit cancellation
+        tasks = [asyncio.ensure_future(self._execute_step(step, previous_results, tools)) for step in steps]
+        try:
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+    
+    async def _execute_step(self, step: PlanStep, previous_results: Dict[str, Any], tools: Dict[str, Any]) -> Dict[str, Any]:
         """Execute a single step in the plan."""
-        tool_id = step["tool_id"]
-        parameters = step["parameters"]
+        tool_id = step.tool_id
+        parameters = step.parameters
         
         # Substitute any references to previous results
         parameters = self._substitute_references(parameters, previous_results)
         
-        # Get the tool
-        tool = await self.tool_registry.get_tool(tool_id)
+        # Get the tool; one that failed to preload is retried so its error surfaces here
+        tool = tools.get(tool_id) or await self.tool_registry.get_tool(tool_id)
         
         # Execute the tool
         result = await tool.execute(**parameters)
         
         return result
     
-    def _group_by_dependencies(self, plan: List[Dict[str, Any]]) -> List[List[int]]:
+    def _group_by_dependencies(self, plan: List[PlanStep]) -> List[List[int]]:
         """Group steps by dependency level for parallel execution."""
+        # Kahn's algorithm, one level per pass: O(steps + dependencies). Indices outside the
+        # plan are ignored, as the LLM sometimes emits them.
+        indegree = [0] * len(plan)
+        children = [[] for _ in plan]
+        for idx, step in enumerate(plan):
+            for dep in set(step.depends_on):
+                if 0 <= dep < len(plan):
+                    children[dep].append(idx)
+                    indegree[idx] += 1
+        
         levels = []
-        processed = set()
+        ready = deque(idx for idx, count in enumerate(indegree) if count == 0)
         
-        while len(processed) < len(plan):
-            current_level = []
+        while ready:
+            current_level = sorted(ready)
+            ready.clear()
             
-            for idx, step in enumerate(plan):
-                if idx in processed:
-                    continue
-                
-                # Check if all dependencies are processed
-                deps = step.get("depends_on", [])
-                if all(dep in processed for dep in deps):
-                    current_level.append(idx)
+            for idx in current_level:
+                for child in children[idx]:
+                    indegree[child] -= 1
+                    if indegree[child] == 0:
+                        ready.append(child)
             
             levels.append(current_level)
-            processed.update(current_level)
+        
+        # Steps left with unmet dependencies are on a cycle and could never run
+        blocked = [idx for idx, count in enumerate(indegree) if count]
+        if blocked:
+            raise ValueError(f"Dependency cycle between plan steps {blocked}")
         
         return levels
     
     def _substitute_references(self, parameters: Dict[str, Any], results: Dict[str, Any]) -> Dict[str, Any]:
         """Substitute references to previous results in parameters."""
+        # Fast path: most parameters hold no references, so scan without copying anything
+        stack = [parameters]
+        while stack:
+            obj = stack.pop()
+            obj_type = type(obj)
+            if obj_type is str:
+                if obj.startswith("$"):
+                    break
+            elif obj_type is dict:
+                stack.extend(obj.values())
+            elif obj_type is list:
+                stack.extend(obj)
+        else:
+            return parameters
+        
         def substitute(obj):
             if isinstance(obj, str) and obj.startswith("$"):
                 # This is a reference to a previous result
@@ -255,84 +462,91 @@ If no tools are needed, set tools_to_use to an empty array.
         
         return substitute(parameters)
     
-    def _update_context_from_execution(self, conversation_id: str, analysis: Dict[str, Any], results: Dict[str, Any]):
+    async def _update_context_from_execution(self, conversation_id: str, analysis: AnalysisResult, results: Dict[str, Any], context: Optional[Dict[str, Any]] = None, query: str = ''):
         """Update context based on what was executed."""
         updates = {}
         
         # Extract entities from the analysis
-        entities = analysis.get('entities', {})
-        if 'symbols' in entities and entities['symbols']:
-            updates['last_entity'] = entities['symbols'][0]
-            updates['recent_entities'] = entities['symbols']
+        symbols = analysis.entities.symbols
+        if symbols:
+            updates['last_entity'] = symbols[0]
+            updates['recent_entities'] = symbols
         
         # Track tool usage
-        tools_used = analysis.get('tools_to_use', [])
-        if tools_used:
-            updates['last_tool'] = tools_used[0].get('tool_key')
+        if analysis.tools_to_use:
+            updates['last_tool'] = analysis.tools_to_use[0].tool_key
+            tool_keys = {config.tool_key for config in analysis.tools_to_use}
+            topic = next((topic for prefix, topic in _TOPIC_BY_PREFIX if any(key.startswith(prefix) for key in tool_keys)), None)
+            if topic:
+                updates['topic'] = topic
         
-        # Update the context
-        self.context_manager.update(conversation_id, analysis.get('query', ''), updates)
+        # Update the context, reusing the copy loaded at the start of the request
+        await _run_nosync(
+            self.context_manager.update, conversation_id, query, updates, existing_context=context
+        )
     
-    async def format_response(self, results: Dict[str, Any]) -> str:
+    async def format_response(self, results: Dict[str, Any], query: str = '') -> str:
         """Format the results into a human-readable response."""
-        prompt = f"""
-        Format the following analysis results into a clear, concise response:
-        
-        Results: {json.dumps(results, indent=2)}
+        local = self._local_response(results, query)
+        if local is not None:
+            return local
         
-        Guidelines:
-        - Start with a summary of key findings
-        - Use bullet points for important metrics
-        - Include specific numbers and percentages
-        - Provide actionable insights
-        - End with a recommendation if applicable
-        """
+        prompt = _RESULTS_TEMPLATE.format_map({"results": _prompt_json(results)})
         
-        response = await self.llm_adapter.complete(prompt, temperature=0.7)
+        response = await self.llm_adapter.complete(prompt, system=_FORMAT_RESPONSE_SYSTEM_PROMPT, temperature=0.7)
         return response
     
     async def process_request_stream(self, query: str, conversation_id: str):
         """Process request with streaming response."""
-        context = self.context_manager.get_context(conversation_id)
+        context = await _run_nosync(self.context_manager.get_context, conversation_id)
         context['conversation_id'] = conversation_id
         
         yield {"type": "status", "message": "Analyzing your query..."}
         
-        analysis = await self.analyze_intent(query, context)
-        required_tools = await self.determine_tools(analysis)
+        analysis = await self.plan_and_select(query, context)
+        required_tools = self.determine_tools(analysis)
         
         if required_tools:
             yield {"type": "status", "message": f"Using {len(required_tools)} tools to gather data..."}
             
-            tools = await self.tool_registry.load_tools(required_tools)
-            
-            yield {"type": "status", "message": "Creating execution plan..."}
-            plan = await self.create_execution_plan(query, tools, context, analysis)
+            plan = analysis.plan
+            if not plan:
+                yield {"type": "status", "message": "Creating execution plan..."}
+                _, plan = await asyncio.gather(
+                    self.tool_registry.load_tools(required_tools),
+                    self.create_execution_plan(query, required_tools, context, analysis)
+                )
             
             yield {"type": "status", "message": "Executing analysis..."}
             results = await self.execute_plan(plan)
             
             # Update context
-            self._update_context_from_execution(conversation_id, analysis, results)
+            await self._update_context_from_execution(conversation_id, analysis, results, context, query)
             
-            # Stream the formatted response
+            # Stream the formatted response, unless the tools already formatted it
+            local = self._local_response(results, query)
+            if local is not None:
+                yield {"type": "content", "chunk": local}
+                return
             prompt = await self._create_format_prompt(results)
-            async for chunk in self.llm_adapter.complete_stream(prompt, temperature=0.7):
-                yield {"type": "content", "chunk": chunk}
+            stream = self.llm_adapter.complete_stream(prompt, system=_FORMAT_PROMPT_SYSTEM_PROMPT, temperature=0.7)
+            async for frame in frame_stream(stream):
+                yield {"type": "content", "chunk": frame}
         else:
             # No tools needed - yield direct response
             yield {"type": "content", "chunk": "I can help you analyze stocks, view technical indicators, check fundamentals, and compare companies. What would you like to know?"}
     
+    def _local_response(self, results: Dict[str, Any], query: str) -> Optional[str]:
+        """Join the tools' own formatted text, or return None if the LLM should write the response."""
+        if not results or _SYNTHESIS_QUERY.search(query):
+            return None
+        parts = []
+        for result in results.values():
+            if not isinstance(result, dict) or "formatted" not in result:
+                return None
+            parts.append(result["formatted"])
+        return "\n\n".join(parts)
+    
     async def _create_format_prompt(self, results: Dict[str, Any]) -> str:
         """Create a prompt for formatting the results."""
-        return f"""
-Format the following analysis results into a clear, professional response:
-
-Results: {json.dumps(results, indent=2)}
-
-Guidelines:
-- Be concise and focus on the key findings
-- Use specific numbers and data points
-- Format numbers appropriately (e.g., $45.23, +2.5%)
-- Provide actionable insights where relevant
-"""
\ No newline at end of file
+        return _RESULTS_TEMPLATE.format_map({"results": _prompt_json(results)})
\ No newline at end of file
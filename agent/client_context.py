@@ -0,0 +1,61 @@
+from typing import Optional, TYPE_CHECKING
+import logging
+
+import httpx
+
+if TYPE_CHECKING:
+    from tools.mcp_client import MCPClient
+
+logger = logging.getLogger(__name__)
+
+# Seconds an idle pooled connection is kept; httpx's 5 s default drops it between user turns
+KEEPALIVE_EXPIRY = 60
+
+class ClientContext:
+    """Process-wide network clients shared by every agent instance.
+    
+    Agents and LLM adapters pull their clients from here instead of creating their own,
+    so constructing an agent per request does not pay for new TLS/HTTP2 sessions.
+    Wrap the application lifetime in ``async with ClientContext():`` (for example in a
+    FastAPI lifespan) to close the pooled connections on shutdown.
+    """
+    
+    _http_client: Optional[httpx.AsyncClient] = None
+    _mcp_client: Optional["MCPClient"] = None
+    
+    @classmethod
+    def get_http_client(cls) -> httpx.AsyncClient:
+        """Get the shared HTTP/2 client used by the LLM provider SDKs."""
+        if cls._http_client is None or cls._http_client.is_closed:
+            cls._http_client = httpx.AsyncClient(
+                http2=True,
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=50, keepalive_expiry=KEEPALIVE_EXPIRY)
+            )
+        return cls._http_client
+    
+    @classmethod
+    def get_mcp_client(cls) -> "MCPClient":
+        """Get the shared default MCP client."""
+        if cls._mcp_client is None:
+            # Imported lazily so LLM-only users do not load the tools package
+            from tools.mcp_client import MCPClient
+            
+            cls._mcp_client = MCPClient()
+        return cls._mcp_client
+    
+    @classmethod
+    async def aclose(cls):
+        """Close the shared clients; they are recreated lazily on next use."""
+        if cls._http_client is not None:
+            await cls._http_client.aclose()
+            cls._http_client = None
+        if cls._mcp_client is not None:
+            await cls._mcp_client.close()
+            cls._mcp_client = None
+        logger.info("Shared clients closed")
+    
+    async def __aenter__(self) -> "ClientContext":
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
\ No newline at end of file
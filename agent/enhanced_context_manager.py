@@ -1,201 +1,450 @@
 from typing import Dict, Any, List, Optional, Tuple
-import json
-from datetime import datetime, timedelta
+from dataclasses import dataclass, field
+from datetime import datetime
+import time
 import redis
+import msgpack
+from cachetools import TTLCache
 import hashlib
+import heapq
+import re
+import sys
 import logging
 from collections import deque
+from itertools import islice
 
 logger = logging.getLogger(__name__)
 
+# Contexts are stored in Redis as a hash of MessagePack fields plus side keys for cached
+# tool results, per-entity history and a message stream, so each write only sends what
+# changed. The version in the prefix keeps older layouts from being read with the wrong
+# key types.
+CONTEXT_KEY_PREFIX = "context:v4:"
+CONTEXT_TTL = 3600 * 24  # 24 hour TTL
+MAX_MESSAGES = 50
+MAX_ENTITY_HISTORY = 100
+MAX_RECENT_ENTITIES = 10
+MAX_TOOL_SEQUENCE = 20
+MAX_SUMMARY_LINES = 3  # Summary lines of the latest messages kept in the context for prompts
+# Seconds a process reuses the raw hashes it last read or wrote. Writes from other processes
+# can go unseen for this long, and a save made meanwhile is based on the older fields.
+LOCAL_CACHE_TTL = 2
+
+# Known tools are stored as small integer ids in tool sequences and entity history; names
+# not listed here are stored as-is. Append new tools only, ids must stay stable.
+TOOL_IDS = {name: idx for idx, name in enumerate((
+    "stock_analyzer",
+    "fundamental_analyzer",
+    "financial_statements",
+    "technical_indicators",
+    "pattern_analyzer",
+    "stock_comparer",
+))}
+TOOL_NAMES = {idx: name for name, idx in TOOL_IDS.items()}
+
+# Hash field name -> path of that value inside the context dict
+_CONTEXT_FIELDS = {
+    "last_entity": ("entities", "last_entity"),
+    "recent_entities": ("entities", "recent_entities"),
+    "last_tool": ("tools", "last_tool"),
+    "tool_sequence": ("tools", "tool_sequence"),
+    "entity_to_keys": ("tools", "entity_to_keys"),
+    "conversation": ("conversation",),
+    "metadata": ("metadata",),
+}
+
+def _pack(value: Any) -> bytes:
+    return msgpack.packb(value, use_bin_type=True, default=list)
+
+def _unpack(data: bytes) -> Any:
+    return msgpack.unpackb(data, raw=False)
+
+# Phrases used by get_contextual_hints, in priority order
+_AMBIGUOUS_PHRASES = ("what about", "how about", "and for", "same for")
+_TIME_PHRASES: Tuple[Tuple[str, Dict[str, str]], ...] = (
+    ("last year", {"period": "1y"}),
+    ("last month", {"period": "1mo"}),
+    ("last week", {"period": "1wk"}),
+    ("yesterday", {"period": "1d"}),
+    ("ytd", {"period": "ytd"}),
+    ("year to date", {"period": "ytd"}),
+)
+_COMPARE_WORDS = ("compare", "versus", "vs", "against", "with")
+
+# All hint phrases matched in a single regex pass over the query; the lookahead reports
+# overlapping matches, like separate substring checks would
+_HINT_PATTERN = re.compile("(?=(" + "|".join(
+    re.escape(phrase) for phrase in sorted(
+        {*_AMBIGUOUS_PHRASES, *(phrase for phrase, _ in _TIME_PHRASES), *_COMPARE_WORDS, "why"},
+        key=len, reverse=True
+    )
+) + "))")
+# Queries shorter than the shortest phrase cannot match any hint
+_MIN_HINT_LENGTH = min(len(phrase) for phrase in (*_AMBIGUOUS_PHRASES, *(p for p, _ in _TIME_PHRASES), *_COMPARE_WORDS, "why"))
+
+def _default_metadata() -> Dict[str, Any]:
+    now = time.time()
+    return {"created_at": now, "last_updated": now, "interaction_count": 0}
+
+# Section name -> builder for the enhanced default context
+_DEFAULT_SECTIONS = {
+    "entities": lambda: {
+        "last_entity": None,
+        "recent_entities": deque(maxlen=MAX_RECENT_ENTITIES)  # Packed as a list for Redis
+    },
+    "tools": lambda: {
+        "last_tool": None,
+        "tool_sequence": deque(maxlen=MAX_TOOL_SEQUENCE),  # Packed as a list for Redis
+        "tool_results": {},  # Cache recent tool results
+        "entity_to_keys": {},  # Entity -> tool_results keys that mention it
+        "expiry_heap": []  # Min-heap of (ts, key) for tool_results, rebuilt on load
+    },
+    "conversation": lambda: {
+        "topic": None,
+        "intent_flow": [],  # Track how conversation intent changes
+        "time_context": None,  # Track time-related queries
+        "comparison_context": None,  # Track comparison queries
+        "recent_lines": deque(maxlen=MAX_SUMMARY_LINES)  # Summary line per recent message, packed as a list
+    },
+    "metadata": _default_metadata,
+}
+
+@dataclass(slots=True)
+class ContextualHints:
+    """Hints for tool selection derived from the conversation context and a query."""
+    
+    suggested_entity: Optional[str] = None
+    suggested_tools: List[str] = field(default_factory=list)
+    time_modifier: Optional[Dict[str, Any]] = None
+    comparison_hint: Optional[Dict[str, Any]] = None
+
+class _DefaultContext(dict):
+    """Context dict that builds missing default sections on first access.
+    
+    Read-only lookups on a new conversation only allocate the sections they touch;
+    a section built here is stored, so mutations made through it are kept.
+    """
+    
+    def __missing__(self, key):
+        if key not in _DEFAULT_SECTIONS:
+            raise KeyError(key)
+        value = self[key] = _DEFAULT_SECTIONS[key]()
+        return value
+
+class _ContextChanges:
+    """Parts of a loaded context that were modified and need to be written back."""
+    
+    __slots__ = ("fields", "messages", "history", "results", "expired")
+    
+    def __init__(self):
+        self.fields = set()
+        self.messages = []
+        self.history = []
+        self.results = set()
+        self.expired = []
+
+class _MemoryBackend:
+    """In-process storage for development and tests."""
+    
+    __slots__ = ("store", "history", "messages")
+    
+    def __init__(self):
+        self.store = {}
+        # Entity history lives outside the context, keyed by (conversation_id, entity)
+        self.history = {}
+        # Messages also live outside the context, keyed by conversation_id
+        self.messages = {}
+    
+    def load(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        return self.store.get(conversation_id)
+    
+    def save(self, conversation_id: str, context: Dict[str, Any], changes: _ContextChanges):
+        self.store[conversation_id] = context
+        for entity, entry in changes.history:
+            history_key = (conversation_id, entity)
+            if history_key not in self.history:
+                self.history[history_key] = deque(maxlen=MAX_ENTITY_HISTORY)
+            self.history[history_key].append(entry)
+        if changes.messages:
+            if conversation_id not in self.messages:
+                self.messages[conversation_id] = deque(maxlen=MAX_MESSAGES)
+            self.messages[conversation_id].extend(changes.messages)
+    
+    def get_messages(self, conversation_id: str, n: int) -> List[Dict[str, Any]]:
+        return list(islice(reversed(self.messages.get(conversation_id, ())), n))[::-1]
+    
+    def get_entity_history(self, conversation_id: str, entity: str) -> List[Dict[str, Any]]:
+        return list(self.history.get((conversation_id, entity), ()))
+
+class _RedisBackend:
+    """Redis storage using the field-level layout described at CONTEXT_KEY_PREFIX."""
+    
+    __slots__ = ("redis_client", "local")
+    
+    def __init__(self, redis_url: str):
+        self.redis_client = redis.from_url(redis_url)
+        # Short-lived read-through cache of the raw (fields, results) hashes: one agent turn
+        # reads the same context several times. Only bytes are cached, so every load decodes
+        # a context of its own that the caller may mutate.
+        self.local = TTLCache(maxsize=1024, ttl=LOCAL_CACHE_TTL)
+    
+    def load(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        raw = self.local.get(conversation_id)
+        if raw is None:
+            key = f"{CONTEXT_KEY_PREFIX}{conversation_id}"
+            with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.hgetall(key)
+                pipe.hgetall(f"{key}:results")
+                fields, results = pipe.execute()
+            if not fields:
+                return None
+            raw = self.local[conversation_id] = (
+                {name.decode(): data for name, data in fields.items()},
+                {name.decode(): data for name, data in results.items()}
+            )
+        return self._decode(conversation_id, *raw)
+    
+    def _decode(self, conversation_id: str, fields: Dict[str, bytes], results: Dict[str, bytes]) -> Dict[str, Any]:
+        """Build a context from its raw field and result hashes."""
+        context = _DefaultContext(conversation_id=conversation_id)
+        for name, data in fields.items():
+            *parents, leaf = _CONTEXT_FIELDS[name]
+            target = context
+            for part in parents:
+                target = target[part]
+            target[leaf] = _unpack(data)
+        # Bounded sequences come back as lists; restore them as deques once here
+        entities, tools, conversation = context["entities"], context["tools"], context["conversation"]
+        entities["recent_entities"] = deque(entities["recent_entities"], maxlen=MAX_RECENT_ENTITIES)
+        tools["tool_sequence"] = deque(tools["tool_sequence"], maxlen=MAX_TOOL_SEQUENCE)
+        conversation["recent_lines"] = deque(conversation.get("recent_lines", ()), maxlen=MAX_SUMMARY_LINES)
+        tools["tool_results"] = {k: _unpack(v) for k, v in results.items()}
+        tools["expiry_heap"] = [(v["ts"], k) for k, v in tools["tool_results"].items()]
+        heapq.heapify(tools["expiry_heap"])
+        return context
+    
+    def save(self, conversation_id: str, context: Dict[str, Any], changes: _ContextChanges):
+        with self.redis_client.pipeline(transaction=False) as pipe:
+            fields, results = self._queue_save(pipe, conversation_id, context, changes)
+            pipe.execute()
+        
+        # Later reads in this turn see the new state without another round-trip; a context
+        # that is not cached is read in full on the next load
+        raw = self.local.get(conversation_id)
+        if raw is not None:
+            cached_results = {**raw[1], **results}
+            for tool_key in changes.expired:
+                cached_results.pop(tool_key, None)
+            self.local[conversation_id] = ({**raw[0], **fields}, cached_results)
+    
+    def _queue_save(self, pipe, conversation_id: str, context: Dict[str, Any], changes: _ContextChanges) -> Tuple[Dict[str, bytes], Dict[str, bytes]]:
+        """Add the commands that persist a context's changes to a pipeline.
+        
+        Returns the packed fields and tool results that were written.
+        """
+        key = f"{CONTEXT_KEY_PREFIX}{conversation_id}"
+        side_keys = (f"{key}:messages", f"{key}:results")
+        # Metadata is always written so the main hash exists for new conversations
+        fields = {"metadata": _pack(context["metadata"])}
+        for name in changes.fields:
+            *parents, leaf = _CONTEXT_FIELDS[name]
+            value = context
+            for part in parents:
+                value = value[part]
+            fields[name] = _pack(value[leaf])
+        pipe.hset(key, mapping=fields)
+        
+        # Messages are appended to a stream that Redis trims to roughly the last 50
+        for message in changes.messages:
+            pipe.xadd(side_keys[0], {"data": _pack(message)}, maxlen=MAX_MESSAGES, approximate=True)
+        
+        # Entity history is a capped list per entity, newest first, read only on demand
+        for entity, entry in changes.history:
+            history_key = f"{key}:history:{entity}"
+            pipe.lpush(history_key, _pack(entry))
+            pipe.ltrim(history_key, 0, MAX_ENTITY_HISTORY - 1)
+            pipe.expire(history_key, CONTEXT_TTL)
+        
+        results = context['tools']['tool_results']
+        packed_results = {k: _pack(results[k]) for k in changes.results if k in results}
+        if packed_results:
+            pipe.hset(side_keys[1], mapping=packed_results)
+        if changes.expired:
+            pipe.hdel(side_keys[1], *changes.expired)
+        
+        pipe.expire(key, CONTEXT_TTL)
+        for side_key in side_keys:
+            pipe.expire(side_key, CONTEXT_TTL)
+        return fields, packed_results
+    
+    def get_messages(self, conversation_id: str, n: int) -> List[Dict[str, Any]]:
+        entries = self.redis_client.xrevrange(f"{CONTEXT_KEY_PREFIX}{conversation_id}:messages", count=n)
+        return [_unpack(fields[b"data"]) for _, fields in reversed(entries)]
+    
+    def get_entity_history(self, conversation_id: str, entity: str) -> List[Dict[str, Any]]:
+        entries = self.redis_client.lrange(f"{CONTEXT_KEY_PREFIX}{conversation_id}:history:{entity}", 0, -1)
+        return [_unpack(e) for e in reversed(entries)]
+
 class EnhancedContextManager:
     """Enhanced context manager that tracks entities, tools, and conversation flow."""
     
+    __slots__ = ("_backend",)
+    
     def __init__(self, redis_url: str = None):
-        if redis_url:
-            self.redis_client = redis.from_url(redis_url)
-        else:
-            # Use in-memory storage for development
-            self.memory_store = {}
+        # The storage backend is chosen once; methods never branch on it
+        self._backend = _RedisBackend(redis_url) if redis_url else _MemoryBackend()
     
     def get_context(self, conversation_id: str) -> Dict[str, Any]:
         """Retrieve enhanced context for a conversation."""
-        context = None
-        
-        if hasattr(self, 'redis_client'):
-            data = self.redis_client.get(f"context:{conversation_id}")
-            if data:
-                context = json.loads(data)
-        else:
-            context = self.memory_store.get(conversation_id)
+        context = self._backend.load(conversation_id)
         
         # Return context if found, otherwise return default enhanced context
         if context:
             return context
         
-        # Return enhanced default context
-        return {
-            "conversation_id": conversation_id,
-            "messages": [],
-            "entities": {
-                "last_entity": None,
-                "recent_entities": deque(maxlen=10),  # Will be converted to list for storage
-                "entity_history": {}  # Track what was done with each entity
-            },
-            "tools": {
-                "last_tool": None,
-                "tool_sequence": deque(maxlen=20),  # Will be converted to list for storage
-                "tool_results": {}  # Cache recent tool results
-            },
-            "conversation": {
-                "topic": None,
-                "intent_flow": [],  # Track how conversation intent changes
-                "time_context": None,  # Track time-related queries
-                "comparison_context": None  # Track comparison queries
-            },
-            "metadata": {
-                "created_at": datetime.now().isoformat(),
-                "last_updated": datetime.now().isoformat(),
-                "interaction_count": 0
-            }
-        }
+        return self._default_context(conversation_id)
     
-    def update(self, conversation_id: str, query: str, updates: Dict[str, Any]):
-        """Update conversation context with rich information."""
-        context = self.get_context(conversation_id)
-        
-        # Convert deques to lists for storage
-        if isinstance(context.get('entities', {}).get('recent_entities'), deque):
-            context['entities']['recent_entities'] = list(context['entities']['recent_entities'])
-        if isinstance(context.get('tools', {}).get('tool_sequence'), deque):
-            context['tools']['tool_sequence'] = list(context['tools']['tool_sequence'])
+    def _default_context(self, conversation_id: str) -> Dict[str, Any]:
+        """Build the enhanced default context for a new conversation; sections are created on first access."""
+        return _DefaultContext(conversation_id=conversation_id)
+    
+    def update(self, conversation_id: str, query: str, updates: Dict[str, Any], existing_context: Optional[Dict[str, Any]] = None):
+        """Update conversation context with rich information.
+        
+        Callers that already loaded the context pass it as existing_context to skip a second read.
+        """
+        context = existing_context if existing_context is not None else self.get_context(conversation_id)
+        changes = _ContextChanges()
+        self._update_in_place(context, query, updates, changes)
+        self._save(conversation_id, context, changes)
+    
+    def _update_in_place(self, context: Dict[str, Any], query: str, updates: Dict[str, Any], changes: _ContextChanges):
+        """Apply an interaction to a loaded context without touching storage."""
+        # Build default metadata (if any) before taking the timestamp it is compared with
+        metadata = context["metadata"]
+        # One epoch timestamp for every record written by this interaction
+        now = time.time()
         
         # Update entities
         if 'last_entity' in updates:
             context['entities']['last_entity'] = updates['last_entity']
             
-            # Convert back to deque for operations
-            recent = deque(context['entities']['recent_entities'], maxlen=10)
+            # recent_entities is a bounded deque, so append drops the oldest entry
+            recent = context['entities']['recent_entities']
             if updates['last_entity'] not in recent:
                 recent.append(updates['last_entity'])
-            context['entities']['recent_entities'] = list(recent)
+            changes.fields.update(("last_entity", "recent_entities"))
             
             # Track what was done with this entity
             if 'last_tool' in updates:
-                if updates['last_entity'] not in context['entities']['entity_history']:
-                    context['entities']['entity_history'][updates['last_entity']] = []
-                context['entities']['entity_history'][updates['last_entity']].append({
-                    "tool": updates['last_tool'],
-                    "timestamp": datetime.now().isoformat()
-                })
+                changes.history.append((updates['last_entity'], {"tool": TOOL_IDS.get(updates['last_tool'], updates['last_tool']), "ts": now}))
         
         # Update tools
         if 'last_tool' in updates:
             context['tools']['last_tool'] = updates['last_tool']
             
-            # Convert back to deque for operations
-            tool_seq = deque(context['tools']['tool_sequence'], maxlen=20)
-            tool_seq.append(updates['last_tool'])
-            context['tools']['tool_sequence'] = list(tool_seq)
+            context['tools']['tool_sequence'].append(TOOL_IDS.get(updates['last_tool'], updates['last_tool']))
+            changes.fields.update(("last_tool", "tool_sequence"))
         
         # Update conversation flow
         if 'topic' in updates:
             context['conversation']['topic'] = updates['topic']
+            changes.fields.add("conversation")
         
         if 'time_context' in updates:
             context['conversation']['time_context'] = updates['time_context']
+            changes.fields.add("conversation")
         
         if 'comparison_context' in updates:
             context['conversation']['comparison_context'] = updates['comparison_context']
+            changes.fields.add("conversation")
         
         # Cache tool results if provided
         if 'tool_results' in updates:
+            entity_to_keys = context['tools'].setdefault('entity_to_keys', {})
+            expiry_heap = context['tools'].setdefault('expiry_heap', [])
             for tool_key, result in updates['tool_results'].items():
                 # Cache with timestamp
                 context['tools']['tool_results'][tool_key] = {
                     "result": result,
-                    "timestamp": datetime.now().isoformat()
+                    "ts": now
                 }
+                changes.results.add(tool_key)
+                heapq.heappush(expiry_heap, (now, tool_key))
+                
+                # Index the result under its entity so lookups avoid scanning every key
+                entity = self._entity_from_key(tool_key, updates.get('last_entity'))
+                if entity:
+                    keys = entity_to_keys.setdefault(entity, [])
+                    if tool_key not in keys:
+                        keys.append(tool_key)
+                        changes.fields.add("entity_to_keys")
         
         # Add message to history
-        context["messages"].append({
-            "timestamp": datetime.now().isoformat(),
+        self._record_message(context, {
+            "ts": now,
             "query": query,
             "updates": updates,
             "hash": self._hash_message(query)
-        })
-        
-        # Keep only last 50 messages
-        if len(context["messages"]) > 50:
-            context["messages"] = context["messages"][-50:]
+        }, changes)
         
         # Update metadata
-        context["metadata"]["last_updated"] = datetime.now().isoformat()
-        context["metadata"]["interaction_count"] += 1
+        metadata["last_updated"] = now
+        metadata["interaction_count"] += 1
+        changes.fields.add("metadata")
         
         # Clean old cached results (older than 10 minutes)
-        self._clean_old_cache(context['tools']['tool_results'])
-        
-        # Save context
-        if hasattr(self, 'redis_client'):
-            self.redis_client.setex(
-                f"context:{conversation_id}",
-                3600 * 24,  # 24 hour TTL
-                json.dumps(context)
-            )
-        else:
-            self.memory_store[conversation_id] = context
+        expired = self._clean_old_cache(context['tools']['tool_results'], context['tools'].setdefault('expiry_heap', []))
+        if expired:
+            changes.expired.extend(expired)
+            self._unindex_results(context, expired)
+            changes.fields.add("entity_to_keys")
     
-    def get_contextual_hints(self, conversation_id: str, query: str) -> Dict[str, Any]:
+    def _save(self, conversation_id: str, context: Dict[str, Any], changes: _ContextChanges):
+        """Write the changed parts of a context back to storage."""
+        self._backend.save(conversation_id, context, changes)
+    
+    def get_contextual_hints(self, conversation_id: str, query: str) -> ContextualHints:
         """Get hints for tool selection based on context and query."""
+        hints = ContextualHints()
+        if not query or len(query) < _MIN_HINT_LENGTH:
+            return hints
+        
+        matched = {m.group(1) for m in _HINT_PATTERN.finditer(query.lower())}
+        if not matched:
+            # Standalone query: no phrase to resolve, so the context is not loaded
+            return hints
         context = self.get_context(conversation_id)
-        hints = {
-            "suggested_entity": None,
-            "suggested_tools": [],
-            "time_modifier": None,
-            "comparison_hint": None
-        }
-        
-        query_lower = query.lower()
         
         # Check for ambiguous references
-        if any(phrase in query_lower for phrase in ["what about", "how about", "and for", "same for"]):
+        if any(phrase in matched for phrase in _AMBIGUOUS_PHRASES):
             # Suggest using last entity
-            hints["suggested_entity"] = context['entities']['last_entity']
+            hints.suggested_entity = context['entities']['last_entity']
             
             # Suggest similar tool as last used
             if context['tools']['last_tool']:
-                hints["suggested_tools"].append(context['tools']['last_tool'])
+                hints.suggested_tools.append(context['tools']['last_tool'])
         
         # Check for time modifiers
-        time_phrases = {
-            "last year": {"period": "1y"},
-            "last month": {"period": "1mo"},
-            "last week": {"period": "1wk"},
-            "yesterday": {"period": "1d"},
-            "ytd": {"period": "ytd"},
-            "year to date": {"period": "ytd"}
-        }
-        
-        for phrase, time_info in time_phrases.items():
-            if phrase in query_lower:
-                hints["time_modifier"] = time_info
+        for phrase, time_info in _TIME_PHRASES:
+            if phrase in matched:
+                hints.time_modifier = time_info
                 break
         
         # Check for comparison references
-        if any(word in query_lower for word in ["compare", "versus", "vs", "against", "with"]):
+        if any(word in matched for word in _COMPARE_WORDS):
             # Get recent entities for comparison
             recent = list(context['entities']['recent_entities'])
             if len(recent) >= 2:
-                hints["comparison_hint"] = {
+                hints.comparison_hint = {
                     "entities": recent[-2:],  # Last two entities
                     "suggested_tool": "stock_comparer"
                 }
         
         # Check for follow-up patterns
-        if "why" in query_lower and context['entities']['last_entity']:
+        if "why" in matched and context['entities']['last_entity']:
             # User asking why something happened - might need news tool in future
-            hints["suggested_tools"].append("news_analyzer")  # Future tool
+            hints.suggested_tools.append("news_analyzer")  # Future tool
         
         return hints
     
@@ -211,19 +460,24 @@ class EnhancedContextManager:
         }
         
         # Get history for this entity
-        if entity in context['entities']['entity_history']:
-            history = context['entities']['entity_history'][entity]
-            if history:
-                entity_context["last_analyzed"] = history[-1]["timestamp"]
-                entity_context["tools_used"] = [h["tool"] for h in history]
+        history = self._get_entity_history(conversation_id, entity)
+        if history:
+            # Timestamps are stored as epoch floats; format only for the caller
+            entity_context["last_analyzed"] = datetime.fromtimestamp(history[-1]["ts"]).isoformat()
+            entity_context["tools_used"] = [TOOL_NAMES.get(h["tool"], h["tool"]) for h in history if "tool" in h]
         
         # Get cached results for this entity
-        for key, value in context['tools']['tool_results'].items():
-            if entity in key:
-                entity_context["cached_results"][key] = value
+        tool_results = context['tools']['tool_results']
+        for key in context['tools'].get('entity_to_keys', {}).get(entity, ()):
+            if key in tool_results:
+                entity_context["cached_results"][key] = tool_results[key]
         
         return entity_context
     
+    def _get_entity_history(self, conversation_id: str, entity: str) -> List[Dict[str, Any]]:
+        """Load the recorded events for an entity, oldest first."""
+        return self._backend.get_entity_history(conversation_id, entity)
+    
     def suggest_next_analysis(self, conversation_id: str) -> List[Dict[str, str]]:
         """Suggest next analysis steps based on conversation flow."""
         context = self.get_context(conversation_id)
@@ -246,8 +500,8 @@ class EnhancedContextManager:
         if last_tool in tool_flow:
             for suggested_tool in tool_flow[last_tool]:
                 # Only suggest if not recently used
-                recent_tools = context['tools']['tool_sequence'][-3:] if len(context['tools']['tool_sequence']) >= 3 else context['tools']['tool_sequence']
-                if suggested_tool not in recent_tools:
+                recent_tools = islice(reversed(context['tools']['tool_sequence']), 3)
+                if TOOL_IDS.get(suggested_tool, suggested_tool) not in recent_tools:
                     suggestions.append({
                         "tool": suggested_tool,
                         "reason": f"Natural follow-up to {last_tool}",
@@ -256,37 +510,69 @@ class EnhancedContextManager:
         
         return suggestions[:2]  # Limit suggestions
     
-    def _clean_old_cache(self, cache: Dict[str, Any], max_age_minutes: int = 10):
-        """Remove cached results older than max_age_minutes."""
-        current_time = datetime.now()
+    def _clean_old_cache(self, cache: Dict[str, Any], heap: List[Tuple[float, str]], max_age_minutes: int = 10):
+        """Remove cached results older than max_age_minutes and return the removed keys.
+        
+        Only the expired entries at the front of the heap are visited. Entries left
+        behind by a result that was cached again are skipped, since their ts no longer matches.
+        """
+        cutoff = time.time() - max_age_minutes * 60
         keys_to_remove = []
         
-        for key, value in cache.items():
-            if 'timestamp' in value:
-                timestamp = datetime.fromisoformat(value['timestamp'])
-                if current_time - timestamp > timedelta(minutes=max_age_minutes):
-                    keys_to_remove.append(key)
+        while heap and heap[0][0] < cutoff:
+            ts, key = heapq.heappop(heap)
+            entry = cache.get(key)
+            if entry is not None and entry.get('ts', 0) == ts:
+                del cache[key]
+                keys_to_remove.append(key)
         
-        for key in keys_to_remove:
-            del cache[key]
+        return keys_to_remove
+    
+    def _entity_from_key(self, tool_key: str, last_entity: Optional[str] = None) -> Optional[str]:
+        """Get the entity a result key refers to, using the "{tool}:{entity}:..." convention."""
+        parts = tool_key.split(":", 2)
+        if len(parts) > 1 and parts[1]:
+            return parts[1]
+        # Other key formats are attributed to the interaction's entity when they mention it
+        if last_entity and last_entity in tool_key:
+            return last_entity
+        return None
+    
+    def _unindex_results(self, context: Dict[str, Any], keys: List[str]):
+        """Drop removed result keys from the entity index."""
+        removed = set(keys)
+        entity_to_keys = context['tools'].get('entity_to_keys', {})
+        for entity in list(entity_to_keys):
+            remaining = [k for k in entity_to_keys[entity] if k not in removed]
+            if remaining:
+                entity_to_keys[entity] = remaining
+            else:
+                del entity_to_keys[entity]
     
     def _hash_message(self, message: str) -> str:
         """Create a hash of a message for deduplication."""
-        return hashlib.sha256(message.encode()).hexdigest()[:16]
+        # 64-bit BLAKE2b digest: same 16 hex chars as before, without hashing a full SHA-256
+        return hashlib.blake2b(message.encode(), digest_size=8).hexdigest()
+    
+    def get_messages(self, conversation_id: str, n: int = 10) -> List[Dict[str, Any]]:
+        """Get the last n messages of a conversation, oldest first."""
+        return self._backend.get_messages(conversation_id, n)
     
     def get_conversation_summary(self, conversation_id: str) -> Dict[str, Any]:
         """Get a summary of the conversation for agent context."""
-        context = self.get_context(conversation_id)
-        
-        # Ensure we're working with lists, not deques
-        recent_entities = list(context['entities']['recent_entities']) if isinstance(context['entities']['recent_entities'], deque) else context['entities']['recent_entities']
-        tool_sequence = list(context['tools']['tool_sequence']) if isinstance(context['tools']['tool_sequence'], deque) else context['tools']['tool_sequence']
+        return self.summarize_context(self.get_context(conversation_id))
+    
+    def summarize_context(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        """Summarize an already loaded context, as get_conversation_summary does."""
+        # Last five of each bounded deque, oldest first
+        recent_entities = list(islice(reversed(context['entities']['recent_entities']), 5))[::-1]
+        tool_sequence = list(islice(reversed(context['tools']['tool_sequence']), 5))[::-1]
         
         return {
             "last_entity": context['entities']['last_entity'],
-            "recent_entities": recent_entities[-5:] if recent_entities else [],
+            "recent_entities": recent_entities,
             "last_tool": context['tools']['last_tool'],
-            "recent_tools": tool_sequence[-5:] if tool_sequence else [],
+            "recent_tools": [TOOL_NAMES.get(t, t) for t in tool_sequence],
             "topic": context['conversation']['topic'],
             "interaction_count": context['metadata']['interaction_count']
         }
@@ -294,46 +580,77 @@ class EnhancedContextManager:
     def add_message(self, conversation_id: str, message: Dict[str, Any]):
         """Add a message to the conversation history."""
         context = self.get_context(conversation_id)
+        changes = _ContextChanges()
+        self._add_message_in_place(context, message, changes)
+        self._save(conversation_id, context, changes)
+    
+    def _add_message_in_place(self, context: Dict[str, Any], message: Dict[str, Any], changes: _ContextChanges):
+        """Append a message to a loaded context without touching storage."""
+        metadata = context['metadata']
+        now = time.time()
         
         # Add timestamp if not present
-        if 'timestamp' not in message:
-            message['timestamp'] = datetime.now().isoformat()
+        if 'ts' not in message:
+            message['ts'] = now
         
         # Add to messages
-        context['messages'].append(message)
+        self._record_message(context, message, changes)
         
         # Update metadata
-        context['metadata']['last_updated'] = datetime.now().isoformat()
-        context['metadata']['interaction_count'] += 1
-        
-        # Save context
-        self.update(conversation_id, "", context)
+        metadata['last_updated'] = now
+        metadata['interaction_count'] += 1
+    
+    def _record_message(self, context: Dict[str, Any], message: Dict[str, Any], changes: _ContextChanges):
+        """Queue a message for the message stream and keep its summary line in the context."""
+        changes.messages.append(message)
+        
+        # Built once here so prompts can read the latest lines without loading messages
+        parts = []
+        if "query" in message:
+            parts.append(f"Previous query: {message['query']}")
+        results = message.get("results")
+        if isinstance(results, dict) and "symbols" in results:
+            parts.append(f"Previously analyzed: {results['symbols']}")
+        if parts:
+            context['conversation'].setdefault('recent_lines', deque(maxlen=MAX_SUMMARY_LINES)).append(" | ".join(parts))
+            changes.fields.add("conversation")
+    
+    def get_recent_lines(self, context: Dict[str, Any]) -> Tuple[str, ...]:
+        """Get the summary lines of a loaded context's latest messages, oldest first."""
+        # .get does not build a missing default section, so new conversations allocate nothing
+        return tuple(context.get('conversation', {}).get('recent_lines', ()))
     
     def track_entity(self, conversation_id: str, entity_type: str, entity_value: str):
         """Track an entity in the conversation."""
         context = self.get_context(conversation_id)
+        changes = _ContextChanges()
+        self._track_entity_in_place(context, entity_type, entity_value, changes)
+        self._save(conversation_id, context, changes)
+    
+    def track_execution(self, conversation_id: str, message: Dict[str, Any], entities: List[Tuple[str, str]], existing_context: Optional[Dict[str, Any]] = None):
+        """Record an execution message and the entities it touched with one read and one write.
+        
+        Callers that already loaded the context pass it as existing_context to skip the read.
+        """
+        context = existing_context if existing_context is not None else self.get_context(conversation_id)
+        changes = _ContextChanges()
+        self._add_message_in_place(context, message, changes)
+        for entity_type, entity_value in entities:
+            self._track_entity_in_place(context, entity_type, entity_value, changes)
+        self._save(conversation_id, context, changes)
+    
+    def _track_entity_in_place(self, context: Dict[str, Any], entity_type: str, entity_value: str, changes: _ContextChanges):
+        """Track an entity in a loaded context without touching storage."""
+        now = time.time()
+        # Tickers repeat across the context; share one string object per distinct value
+        entity_value = sys.intern(entity_value)
         
         # Update last entity
         context['entities']['last_entity'] = entity_value
         
-        # Add to recent entities (handle deque)
-        if isinstance(context['entities']['recent_entities'], deque):
-            context['entities']['recent_entities'].append(entity_value)
-        else:
-            context['entities']['recent_entities'] = deque(context['entities']['recent_entities'], maxlen=10)
-            context['entities']['recent_entities'].append(entity_value)
+        # Add to recent entities
+        context['entities']['recent_entities'].append(entity_value)
         
         # Track in entity history
-        if entity_value not in context['entities']['entity_history']:
-            context['entities']['entity_history'][entity_value] = {
-                'type': entity_type,
-                'first_seen': datetime.now().isoformat(),
-                'last_seen': datetime.now().isoformat(),
-                'count': 0
-            }
-        
-        context['entities']['entity_history'][entity_value]['count'] += 1
-        context['entities']['entity_history'][entity_value]['last_seen'] = datetime.now().isoformat()
-        
-        # Save context
-        self.update(conversation_id, "", context)
\ No newline at end of file
+        changes.fields.update(("last_entity", "recent_entities"))
+        changes.history.append((entity_value, {"type": entity_type, "ts": now}))
\ No newline at end of file
@@ -1,32 +1,95 @@
-from langchain.chains import LLMChain
 from langchain.output_parsers import PydanticOutputParser, OutputFixingParser
-from langchain.prompts import PromptTemplate, ChatPromptTemplate
-from langchain.schema import BaseOutputParser
-from pydantic import BaseModel, Field, validator
-from typing import List, Dict, Any, Optional
+from langchain.prompts import PromptTemplate
+from langchain.schema import BaseOutputParser, BaseMessage, HumanMessage, SystemMessage
+from langchain_core.exceptions import OutputParserException
+from pydantic import BaseModel, Field, ValidationError
+from typing import Collection, List, Dict, Any, Optional, Tuple
 import re
 import asyncio
 from datetime import datetime
 import logging
-import json
+
+import orjson
 
 from agent.llm_adapter import LLMAdapter
+from agent.client_context import ClientContext
 from agent.enhanced_context_manager import EnhancedContextManager
+from agent.fast_router import FastRouter, RoutedQuery
+from agent.query_cache import QueryCache
+from agent.stream_frames import coalesce_stream, frame_stream
 from tools.registry.enhanced_dynamic_loader import EnhancedDynamicToolRegistry
-from tools.mcp_client import MCPClient
-from tools.registry import TOOL_REGISTRY, get_tool_descriptions_for_prompt
+from tools.registry import TOOL_REGISTRY, get_tool_descriptions_for_prompt, get_registry_version
 
 logger = logging.getLogger(__name__)
 
+MAX_TOOL_CONCURRENCY = 8  # Tool executions in flight per agent, across requests
+# Plan parameter that takes its value from an earlier step's result, e.g. "$steps.0.price"
+_STEP_REF = re.compile(r"^\$steps\.(\d+)(?:\.(.+))?$")
+
+# Common LLM output parameter names -> the names tools expect
+_PARAM_MAP = {
+    'symbols': 'symbol',  # LLM often outputs plural, tools expect singular
+    'time_period': 'period',  # More descriptive name to shorter name
+    'ticker': 'symbol',  # Alternative naming
+    'tickers': 'symbol',  # Alternative plural
+    'stock': 'symbol',  # Alternative naming
+    'stocks': 'symbol',  # Alternative plural
+}
+# Mapped names that take a single value, so a list is reduced to its first item
+_SINGULAR_PARAMS = frozenset(name for name in _PARAM_MAP.values() if not name.endswith('s'))
+
+def _transform_stock_analyzer(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Build stock_analyzer's fixed {symbol, period} parameters in one pass."""
+    transformed = {}
+    if 'symbols' in params:
+        symbols = params['symbols']
+        # Convert list to single value if needed
+        transformed['symbol'] = (symbols[0] if symbols else "SPY") if isinstance(symbols, list) else symbols
+    elif 'symbol' in params:
+        transformed['symbol'] = params['symbol']
+    transformed['period'] = params.get('time_period', params.get('period', '1mo'))
+    return transformed
+
+def _transform_generic(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Rename parameters through _PARAM_MAP, keeping names it does not know."""
+    transformed = {}
+    for key, value in params.items():
+        mapped_key = _PARAM_MAP.get(key)
+        if mapped_key is None:
+            transformed[key] = value
+        elif isinstance(value, list) and mapped_key in _SINGULAR_PARAMS:
+            transformed[mapped_key] = value[0] if value else None
+        else:
+            transformed[mapped_key] = value
+    return transformed
+
+# Tools with a specialized parameter transform; others use _transform_generic
+_TOOL_TRANSFORMS = {
+    "stock_analyzer": _transform_stock_analyzer,
+}
+
+# Outermost JSON object in an LLM completion, the same greedy match PydanticOutputParser uses
+_JSON_OBJECT = re.compile(r"\{.*\}", re.DOTALL)
+
+# Keyword patterns for the regex intent fallback, checked in this order
+_SYMBOL_PATTERN = re.compile(r'\b[A-Z]{1,5}\b')
+_FALLBACK_INTENTS = (
+    ("compare_stocks", re.compile(r'\b(?:compare|versus|vs)\b', re.I)),
+    ("technical_analysis", re.compile(r'\b(?:technical|rsi|macd|bollinger)\b', re.I)),
+    ("fundamental_analysis", re.compile(r'\b(?:fundamental|earnings|revenue|pe)\b', re.I)),
+)
+_INTENT_TOOLS = {
+    "analyze_stock": ("stock_analyzer",),
+    "compare_stocks": ("stock_analyzer",),
+    "technical_analysis": ("technical_indicators",),
+    "fundamental_analysis": ("fundamental_analyzer",),
+}
+
 # Define structured output models
 class StockEntity(BaseModel):
     symbols: List[str] = Field(default_factory=list, description="Stock ticker symbols mentioned")
     time_period: str = Field(default="1mo", description="Time period for analysis")
     indicators: List[str] = Field(default_factory=list, description="Technical indicators requested")
-    
-    @validator('symbols')
-    def uppercase_symbols(cls, v):
-        return [s.upper() for s in v]
 
 class IntentAnalysis(BaseModel):
     intent: str = Field(description="Main intent: analyze_stock, compare_stocks, technical_analysis, fundamental_analysis")
@@ -38,11 +101,51 @@ class IntentAnalysis(BaseModel):
 class ToolParameters(BaseModel):
     tool_name: str = Field(description="Name of the tool to execute")
     parameters: Dict[str, Any] = Field(description="Parameters for the tool")
+    vectorize_over: Optional[str] = Field(default=None, description="Name of a list parameter; the tool runs once per item, concurrently")
     
 class ExecutionPlan(BaseModel):
     steps: List[ToolParameters] = Field(description="Ordered list of tool executions")
     description: str = Field(description="Brief description of the execution plan")
 
+class IntentAndPlan(BaseModel):
+    intent: IntentAnalysis
+    plan: ExecutionPlan = Field(description="Tool executions that answer the query; no steps if no tools are needed")
+
+class _MessagePrompt:
+    """System + human message templates rendered with str.format_map.
+    
+    Uses the same {var} / {{literal}} syntax as ChatPromptTemplate without re-parsing
+    the templates on every request.
+    """
+    
+    __slots__ = ("system", "human")
+    
+    def __init__(self, system: str, human: str):
+        self.system = system
+        self.human = human
+    
+    def render(self, values: Dict[str, Any]) -> List[BaseMessage]:
+        return [
+            SystemMessage(content=self.system.format_map(values)),
+            HumanMessage(content=self.human.format_map(values))
+        ]
+
+class _PromptChain:
+    """Render a prompt and call the adapter's routing LLM, returning {"text": ...} like LLMChain.
+    
+    The model is looked up on each call, so a model the adapter rebuilt is picked up.
+    """
+    
+    __slots__ = ("llm_adapter", "prompt")
+    
+    def __init__(self, llm_adapter: LLMAdapter, prompt: _MessagePrompt):
+        self.llm_adapter = llm_adapter
+        self.prompt = prompt
+    
+    async def ainvoke(self, values: Dict[str, Any]) -> Dict[str, str]:
+        response = await self.llm_adapter.routing_llm.ainvoke(self.prompt.render(values))
+        return {"text": response.content if hasattr(response, 'content') else str(response)}
+
 class EnhancedGenesisAgent:
     """Genesis Agent enhanced with LangChain for structured outputs and better prompt management."""
     
@@ -50,45 +153,44 @@ class EnhancedGenesisAgent:
         self.llm_adapter = LLMAdapter(provider=llm_provider)
         self.tool_registry = EnhancedDynamicToolRegistry()
         self.context_manager = EnhancedContextManager()
-        self.mcp_client = MCPClient()
+        self.mcp_client = ClientContext.get_mcp_client()
+        self._tool_semaphore = asyncio.Semaphore(MAX_TOOL_CONCURRENCY)
+        # (intent, plan) from the LLM for repeated queries
+        self.intent_cache = QueryCache()
+        self.fast_router = FastRouter()
+        # Prompt strings derived from the tool registry, rebuilt when its version changes
+        self._tools_version = None
+        self._tools_csv = ""
+        self._tool_descriptions_cache = {}
         
         # Initialize LangChain components
         self.setup_chains()
     
+    async def warmup(self):
+        """Connect to the MCP servers and load every registry tool ahead of the first request.
+        
+        Run in the background at startup; tools that fail to load are logged and loaded again on use.
+        """
+        tools = await self.tool_registry.load_tools_from_registry(list(TOOL_REGISTRY))
+        self._sync_tool_caches()
+        logger.info(f"Warmed up {len(tools)} of {len(TOOL_REGISTRY)} tools")
+    
     def setup_chains(self):
         """Initialize LangChain components for structured output parsing."""
-        # Create output parser with automatic fixing
-        parser = PydanticOutputParser(pydantic_object=IntentAnalysis)
-        self.intent_parser = OutputFixingParser.from_llm(parser=parser, llm=self.llm_adapter.llm)
+        # Create output parser; an automatic fixing parser is only built when the output does not parse
+        self._raw_intent_parser = PydanticOutputParser(pydantic_object=IntentAnalysis)
         
-        # Create sophisticated prompt template for intent analysis
-        self.intent_prompt = ChatPromptTemplate.from_messages([
-            ("system", """You are a financial analysis intent classifier. 
-            Analyze user queries and extract their intent and entities.
-            
-            Possible intents:
+        # Instructions shared by the separate and the combined prompts
+        intent_instructions = """Possible intents:
             - analyze_stock: Single stock analysis
             - compare_stocks: Multiple stock comparison
             - technical_analysis: Technical indicators focus
             - fundamental_analysis: Company fundamentals focus
             - market_overview: Broad market analysis
             
-            Available tools: {available_tools}
-            
-            {format_instructions}"""),
-            ("human", "Query: {query}\nConversation Context: {context}")
-        ])
-        
-        # Create execution plan parser
-        plan_parser = PydanticOutputParser(pydantic_object=ExecutionPlan)
-        self.plan_parser = OutputFixingParser.from_llm(parser=plan_parser, llm=self.llm_adapter.llm)
+            Available tools: {available_tools}"""
         
-        # Create execution plan prompt
-        self.plan_prompt = ChatPromptTemplate.from_messages([
-            ("system", """You are a financial analysis execution planner.
-            Create a step-by-step plan using available tools.
-            
-            CRITICAL PARAMETER RULES - YOU MUST FOLLOW THESE EXACTLY:
+        plan_instructions = """CRITICAL PARAMETER RULES - YOU MUST FOLLOW THESE EXACTLY:
             
             For stock_analyzer tool, the parameters MUST be:
             - "symbol": string (single stock symbol, NOT "symbols")  
@@ -114,44 +216,81 @@ class EnhancedGenesisAgent:
             
             ALWAYS use the entities.time_period value to determine the appropriate period!
             
+            Steps run in parallel unless a parameter references an earlier step's result
+            as "$steps.N.field" (N is the 0-based step index), e.g. "$steps.0.price".
+            
             Available tools with descriptions:
-            {tool_descriptions}
+            {tool_descriptions}"""
+        
+        # Create sophisticated prompt template for intent analysis
+        self.intent_prompt = _MessagePrompt(
+            """You are a financial analysis intent classifier. 
+            Analyze user queries and extract their intent and entities.
+            
+            """ + intent_instructions + """
             
-            {format_instructions}"""),
-            ("human", "Intent: {intent}\nEntities: {entities}\nQuery: {query}")
-        ])
+            {format_instructions}""",
+            "Query: {query}\nConversation Context: {context}"
+        )
+        
+        # Create execution plan parser
+        self._raw_plan_parser = PydanticOutputParser(pydantic_object=ExecutionPlan)
         
-        # Create chains without output_parser to avoid double parsing
-        self.intent_chain = LLMChain(
-            llm=self.llm_adapter.llm,
-            prompt=self.intent_prompt
+        # Create execution plan prompt
+        self.plan_prompt = _MessagePrompt(
+            """You are a financial analysis execution planner.
+            Create a step-by-step plan using available tools.
+            
+            """ + plan_instructions + """
+            
+            {format_instructions}""",
+            "Intent: {intent}\nEntities: {entities}\nQuery: {query}"
         )
         
-        self.plan_chain = LLMChain(
-            llm=self.llm_adapter.llm,
-            prompt=self.plan_prompt
+        # Combined intent + plan, so a request needs one LLM round-trip instead of two
+        self._raw_intent_plan_parser = PydanticOutputParser(pydantic_object=IntentAndPlan)
+        self.intent_plan_prompt = _MessagePrompt(
+            """You are a financial analysis intent classifier and execution planner.
+            Analyze the user query, extract its intent and entities, then create a
+            step-by-step plan using the tools listed in required_tools.
+            
+            """ + intent_instructions + """
+            
+            """ + plan_instructions + """
+            
+            {format_instructions}""",
+            "Query: {query}\nConversation Context: {context}"
         )
+        
+        # Create chains without output_parser to avoid double parsing; classification and
+        # planning are structured routing calls, so they use the small deterministic model
+        self.intent_chain = _PromptChain(self.llm_adapter, self.intent_prompt)
+        self.plan_chain = _PromptChain(self.llm_adapter, self.plan_prompt)
+        self.intent_plan_chain = _PromptChain(self.llm_adapter, self.intent_plan_prompt)
+        
+        # Format instructions serialize the model's JSON schema; the schemas are fixed, so build them once
+        self._intent_format_instructions = self._raw_intent_parser.get_format_instructions()
+        self._plan_format_instructions = self._raw_plan_parser.get_format_instructions()
+        self._intent_plan_format_instructions = self._raw_intent_plan_parser.get_format_instructions()
     
     async def analyze_intent_enhanced(self, query: str, context: Dict[str, Any]) -> IntentAnalysis:
         """Enhanced intent analysis with guaranteed structured output."""
         # Extract context summary instead of dumping everything
         context_summary = self._summarize_context(context)
         
-        # Get available tools
-        available_tools = list(TOOL_REGISTRY.keys())
-        
         try:
             # Run the chain
             result = await self.intent_chain.ainvoke({
                 "query": query,
                 "context": context_summary,
-                "available_tools": ", ".join(available_tools),
-                "format_instructions": self.intent_parser.get_format_instructions()
+                "available_tools": self._get_tools_csv(),
+                "format_instructions": self._intent_format_instructions
             })
             
-            # Debug logging
-            logger.debug(f"Chain result type: {type(result)}")
-            logger.debug(f"Chain result: {result}")
+            # Debug logging; checked first so the result is not formatted when DEBUG is off
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Chain result type: %s", type(result))
+                logger.debug("Chain result: %s", result)
             
             # Check if result is already an IntentAnalysis object
             if isinstance(result, IntentAnalysis):
@@ -166,84 +305,209 @@ class EnhancedGenesisAgent:
                 raise ValueError(f"Unexpected result type: {type(result)}")
             
             # Parse the text output
-            return self.intent_parser.parse(text_output)
+            return self._normalize_intent(await self._parse_output(text_output, self._raw_intent_parser))
             
         except Exception as e:
             logger.warning(f"Intent analysis failed, using fallback: {e}")
             # Fallback with regex extraction
             return self._fallback_intent_extraction(query)
     
+    async def analyze_and_plan(self, query: str, context: Dict[str, Any]) -> Tuple[IntentAnalysis, Optional[ExecutionPlan]]:
+        """Analyze intent and create the execution plan in a single LLM call.
+        
+        If the combined call fails, the intent comes from the regex fallback and the plan is None.
+        Results are cached per conversation summary, so a repeated query in the same situation
+        skips the LLM call.
+        """
+        context_summary = self._summarize_context(context)
+        cached = self.intent_cache.get(query, context_summary)
+        if cached is not None:
+            return cached
+        
+        try:
+            result = await self.intent_plan_chain.ainvoke({
+                "query": query,
+                "context": context_summary,
+                "available_tools": self._get_tools_csv(),
+                "tool_descriptions": get_tool_descriptions_for_prompt(),
+                "format_instructions": self._intent_plan_format_instructions
+            })
+            
+            # Extract text from result and parse it
+            if isinstance(result, dict) and 'text' in result:
+                text_output = result['text']
+            elif isinstance(result, str):
+                text_output = result
+            else:
+                raise ValueError(f"Unexpected result type: {type(result)}")
+            
+            combined = await self._parse_output(text_output, self._raw_intent_plan_parser)
+            self._normalize_intent(combined.intent)
+            self.intent_cache.put(query, (combined.intent, combined.plan), context_summary)
+            return combined.intent, combined.plan
+            
+        except Exception as e:
+            logger.warning(f"Combined intent analysis and planning failed, using fallback: {e}")
+            return self._fallback_intent_extraction(query), None
+    
+    async def _parse_output(self, text_output: str, raw_parser: PydanticOutputParser) -> Any:
+        """Parse LLM output, asking the LLM to fix it only if it does not parse as is.
+        
+        The JSON object is parsed and validated in one pass by pydantic-core. Output that is
+        only invalid as strict JSON (e.g. raw newlines inside strings) goes through the lenient
+        json.loads-based parser before the fixing LLM call.
+        """
+        match = _JSON_OBJECT.search(text_output)
+        try:
+            try:
+                return raw_parser.pydantic_object.model_validate_json(match.group() if match else text_output)
+            except ValidationError as e:
+                if e.errors()[0]["type"] != "json_invalid":
+                    raise
+                return raw_parser.parse(text_output)
+        except (OutputParserException, ValidationError) as e:
+            logger.debug("Output did not parse, retrying with the fixing parser: %s", e)
+            fixing_parser = OutputFixingParser.from_llm(parser=raw_parser, llm=self.llm_adapter.routing_llm)
+            return await fixing_parser.aparse(text_output)
+    
+    def _normalize_intent(self, intent: IntentAnalysis) -> IntentAnalysis:
+        """Uppercase the symbols of an LLM-produced intent in place, once per parse."""
+        intent.entities.symbols = list(map(str.upper, intent.entities.symbols))
+        return intent
+    
     def _summarize_context(self, context: Dict[str, Any]) -> str:
         """Create a relevant summary of conversation context."""
-        messages = context.get("messages", [])
-        if not messages:
+        # Summary lines of the last few messages are kept in the loaded context
+        recent_lines = self.context_manager.get_recent_lines(context)
+        if not recent_lines:
             return "No previous context"
         
-        # Get last 3 relevant messages
-        recent_messages = messages[-3:]
-        summary_parts = []
-        
-        for msg in recent_messages:
-            if "query" in msg:
-                summary_parts.append(f"Previous query: {msg['query']}")
-            if "results" in msg and "symbols" in msg["results"]:
-                summary_parts.append(f"Previously analyzed: {msg['results']['symbols']}")
+        return " | ".join(recent_lines)
+    
+    def _sync_tool_caches(self):
+        """Drop the registry-derived prompt strings if tools were registered or removed."""
+        version = get_registry_version()
+        if version != self._tools_version:
+            self._tools_csv = ", ".join(TOOL_REGISTRY.keys())
+            self._tool_descriptions_cache.clear()
+            self._tools_version = version
+    
+    def _get_tools_csv(self) -> str:
+        """Get the comma-separated registry keys shown to the LLM as available tools."""
+        self._sync_tool_caches()
+        return self._tools_csv
+    
+    def _get_tool_descriptions(self, tools: Dict[str, Any]) -> str:
+        """Get the planner's description lines for a set of loaded tools, built once per tool set."""
+        self._sync_tool_caches()
+        key = frozenset(tools)
+        descriptions = self._tool_descriptions_cache.get(key)
+        if descriptions is None:
+            descriptions = self._tool_descriptions_cache[key] = "\n".join([
+                f"- {name}: {tool.get_description()}" for name, tool in tools.items()
+            ])
+        return descriptions
+    
+    def _keyword_intent(self, query: str) -> str:
+        """Classify a query by the first matching keyword pattern, defaulting to analyze_stock."""
+        return next((name for name, pattern in _FALLBACK_INTENTS if pattern.search(query)), "analyze_stock")
+    
+    async def _analyze_request(self, query: str, context: Dict[str, Any]) -> Tuple[IntentAnalysis, Optional[ExecutionPlan], asyncio.Task]:
+        """Get the intent and plan for a query, plus a task loading the tools it most likely needs.
         
-        return " | ".join(summary_parts)
+        Queries the fast router recognizes are planned locally. Others take one LLM round-trip,
+        overlapped with loading the tools the keyword classifier predicts.
+        """
+        routed = self.fast_router.try_match(query)
+        if routed is not None:
+            intent = self._routed_intent(routed)
+            prefetch = self._prefetch_tools(intent.required_tools)
+            return intent, self._create_simple_plan(intent, intent.required_tools), prefetch
+        
+        prefetch = self._prefetch_tools(list(_INTENT_TOOLS.get(self._keyword_intent(query), ())))
+        intent, plan = await self.analyze_and_plan(query, context)
+        return intent, plan, prefetch
+    
+    def _routed_intent(self, routed: RoutedQuery) -> IntentAnalysis:
+        """Build the intent for a query the fast router matched."""
+        return IntentAnalysis.model_construct(
+            intent=routed.intent,
+            entities=StockEntity.model_construct(
+                symbols=routed.symbols,
+                time_period=routed.time_period,
+                indicators=routed.indicators
+            ),
+            confidence=0.9,
+            reasoning="Matched by the keyword router",
+            required_tools=list(_INTENT_TOOLS[routed.intent])
+        )
+    
+    def _prefetch_tools(self, tool_names: List[str]) -> asyncio.Task:
+        """Start loading tools in the background, to overlap with intent analysis."""
+        return asyncio.create_task(self.tool_registry.load_tools_from_registry(tool_names))
+    
+    async def _load_tools(self, required: List[str], prefetch: asyncio.Task) -> Dict[str, Any]:
+        """Load the required tools, reusing the ones the prefetch already loaded."""
+        try:
+            prefetched = await prefetch
+        except Exception as e:
+            logger.warning(f"Tool prefetch failed: {e}")
+            prefetched = {}
+        
+        missing = [key for key in required if key not in prefetched]
+        loaded = await self.tool_registry.load_tools_from_registry(missing) if missing else {}
+        
+        tools = {}
+        for key in required:
+            tool = prefetched.get(key) or loaded.get(key)
+            if tool:
+                tools[key] = tool
+        return tools
     
     def _fallback_intent_extraction(self, query: str) -> IntentAnalysis:
         """Regex-based fallback for intent extraction."""
         # Extract stock symbols
-        symbols = re.findall(r'\b[A-Z]{1,5}\b', query.upper())
+        symbols = _SYMBOL_PATTERN.findall(query.upper())
         
         # Detect intent keywords
-        intent = "analyze_stock"  # default
-        if any(word in query.lower() for word in ["compare", "versus", "vs"]):
-            intent = "compare_stocks"
-        elif any(word in query.lower() for word in ["technical", "rsi", "macd", "bollinger"]):
-            intent = "technical_analysis"
-        elif any(word in query.lower() for word in ["fundamental", "earnings", "revenue", "pe"]):
-            intent = "fundamental_analysis"
+        intent = self._keyword_intent(query)
         
         # Determine required tools based on intent
-        required_tools = []
-        if intent in ["analyze_stock", "compare_stocks"]:
-            required_tools = ["stock_analyzer"]
-        elif intent == "technical_analysis":
-            required_tools = ["technical_indicators"]
-        elif intent == "fundamental_analysis":
-            required_tools = ["fundamental_analyzer"]
-        
-        return IntentAnalysis(
+        required_tools = list(_INTENT_TOOLS.get(intent, ()))
+        
+        # Built from values we just produced, so validation is skipped (model_construct);
+        # symbols are already uppercase since they were matched on the uppercased query
+        return IntentAnalysis.model_construct(
             intent=intent,
-            entities=StockEntity(symbols=symbols or ["SPY"]),  # Default to SPY
+            entities=StockEntity.model_construct(symbols=symbols or ["SPY"]),  # Default to SPY
             confidence=0.5,
             reasoning="Extracted using fallback method",
             required_tools=required_tools
         )
     
-    async def create_execution_plan_enhanced(self, intent: IntentAnalysis, tools: Dict[str, Any]) -> ExecutionPlan:
-        """Create an execution plan using LangChain structured output."""
-        tool_descriptions = "\n".join([
-            f"- {name}: {tool.get_description() if hasattr(tool, 'get_description') else tool.get('description', 'No description')}"
-            for name, tool in tools.items()
-        ])
+    async def create_execution_plan_enhanced(self, intent: IntentAnalysis, tools: Dict[str, Any], entities: Optional[Dict[str, Any]] = None) -> ExecutionPlan:
+        """Create an execution plan using LangChain structured output.
+        
+        entities is intent.entities already dumped to a dict, if the caller has it.
+        """
+        tool_descriptions = self._get_tool_descriptions(tools)
         
         try:
             # Log the prompt for debugging
-            logger.debug(f"Plan prompt template: {self.plan_prompt}")
+            logger.debug("Plan prompt template: %s", self.plan_prompt.system)
             
             result = await self.plan_chain.ainvoke({
                 "intent": intent.intent,
-                "entities": intent.entities.dict(),
+                "entities": entities if entities is not None else intent.entities.model_dump(),
                 "query": intent.reasoning,
                 "tool_descriptions": tool_descriptions,
-                "format_instructions": self.plan_parser.get_format_instructions()
+                "format_instructions": self._plan_format_instructions
             })
             
-            # Debug logging
-            logger.debug(f"Plan chain result type: {type(result)}")
-            logger.debug(f"Plan chain result: {result}")
+            # Debug logging; checked first so the result is not formatted when DEBUG is off
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Plan chain result type: %s", type(result))
+                logger.debug("Plan chain result: %s", result)
             
             # Check if result is already an ExecutionPlan object
             if isinstance(result, ExecutionPlan):
@@ -258,26 +522,31 @@ class EnhancedGenesisAgent:
                 raise ValueError(f"Unexpected result type: {type(result)}")
             
             # Parse the text output
-            return self.plan_parser.parse(text_output)
+            return await self._parse_output(text_output, self._raw_plan_parser)
             
         except Exception as e:
             logger.warning(f"Plan creation failed, using simple plan: {e}")
             # Create simple plan
             return self._create_simple_plan(intent, tools)
     
-    def _create_simple_plan(self, intent: IntentAnalysis, tools: Dict[str, Any]) -> ExecutionPlan:
-        """Create a simple execution plan as fallback."""
+    def _create_simple_plan(self, intent: IntentAnalysis, tools: Collection[str]) -> ExecutionPlan:
+        """Create a simple execution plan for the available tools (names or a name -> tool dict)."""
         steps = []
         
         for tool_name in intent.required_tools:
             if tool_name in tools:
                 # Map parameters correctly based on tool expectations
+                vectorize_over = None
                 if tool_name == "stock_analyzer":
                     # stock_analyzer expects 'symbol' (singular) not 'symbols'
                     params = {
                         "symbol": intent.entities.symbols[0] if intent.entities.symbols else "SPY",
                         "period": intent.entities.time_period
                     }
+                    # Several symbols become one step that runs the tool per symbol concurrently
+                    if len(intent.entities.symbols) > 1:
+                        params["symbol"] = list(intent.entities.symbols)
+                        vectorize_over = "symbol"
                 else:
                     params = {
                         "symbols": intent.entities.symbols,
@@ -288,79 +557,22 @@ class EnhancedGenesisAgent:
                 if tool_name == "technical_indicators" and intent.entities.indicators:
                     params["indicators"] = intent.entities.indicators
                 
-                steps.append(ToolParameters(
+                steps.append(ToolParameters.model_construct(
                     tool_name=tool_name,
-                    parameters=params
+                    parameters=params,
+                    vectorize_over=vectorize_over
                 ))
         
-        return ExecutionPlan(
+        # Steps come from an already validated intent; only LLM output goes through the parsers
+        return ExecutionPlan.model_construct(
             steps=steps,
             description=f"Execute {intent.intent} for {', '.join(intent.entities.symbols)}"
         )
     
     def _transform_parameters_for_tool(self, tool_name: str, params: Dict[str, Any], tool: Any) -> Dict[str, Any]:
         """Transform parameters to match tool expectations."""
-        # For stock_analyzer, we know the expected parameters
-        if tool_name == "stock_analyzer":
-            # Always transform for stock_analyzer regardless of metadata
-            transformed = {}
-            
-            # Handle symbols/symbol parameter
-            if 'symbols' in params:
-                # Convert list to single value if needed
-                if isinstance(params['symbols'], list):
-                    transformed['symbol'] = params['symbols'][0] if params['symbols'] else "SPY"
-                else:
-                    transformed['symbol'] = params['symbols']
-            elif 'symbol' in params:
-                transformed['symbol'] = params['symbol']
-            
-            # Handle time_period/period parameter  
-            if 'time_period' in params:
-                transformed['period'] = params['time_period']
-            elif 'period' in params:
-                transformed['period'] = params['period']
-            else:
-                transformed['period'] = '1mo'  # default
-            
-                
-            logger.debug(f"Transformed parameters for {tool_name}: {params} -> {transformed}")
-            return transformed
-            
-        # For other tools, use the metadata-based approach
-        tool_metadata = tool.metadata if hasattr(tool, 'metadata') else {}
-        expected_params = tool_metadata.get('parameters', {})
-        
-        logger.debug(f"Tool metadata for {tool_name}: {tool_metadata}")
-        logger.debug(f"Expected parameters: {expected_params}")
-        
-        # Create parameter mapping based on common transformations
-        param_mapping = {
-            # Common LLM output -> Tool expected
-            'symbols': 'symbol',  # LLM often outputs plural, tools expect singular
-            'time_period': 'period',  # More descriptive name to shorter name
-            'ticker': 'symbol',  # Alternative naming
-            'tickers': 'symbol',  # Alternative plural
-            'stock': 'symbol',  # Alternative naming
-            'stocks': 'symbol',  # Alternative plural
-        }
-        
-        # Transform parameters
-        transformed = {}
-        for key, value in params.items():
-            # Check if we need to map this parameter
-            if key in param_mapping:
-                mapped_key = param_mapping[key]
-                # Handle list to single value conversion if needed
-                if isinstance(value, list) and not mapped_key.endswith('s'):
-                    transformed[mapped_key] = value[0] if value else None
-                else:
-                    transformed[mapped_key] = value
-            else:
-                # Keep original
-                transformed[key] = value
-        
-        logger.debug(f"Transformed parameters for {tool_name}: {params} -> {transformed}")
+        transformed = _TOOL_TRANSFORMS.get(tool_name, _transform_generic)(params)
+        logger.debug("Transformed parameters for %s: %s -> %s", tool_name, params, transformed)
         return transformed
     
     async def process_request(self, query: str, conversation_id: str) -> Dict[str, Any]:
@@ -370,30 +582,35 @@ class EnhancedGenesisAgent:
             context = self.context_manager.get_context(conversation_id)
             context['conversation_id'] = conversation_id
             
-            # 2. Analyze intent with enhanced parsing
-            intent_analysis = await self.analyze_intent_enhanced(query, context)
+            # 2. Analyze intent and plan the tool calls, while the tools the query most
+            # likely needs are loaded speculatively
+            intent_analysis, plan, prefetch = await self._analyze_request(query, context)
             
             # Ensure we have an IntentAnalysis object
             if isinstance(intent_analysis, dict):
-                intent_analysis = IntentAnalysis(**intent_analysis)
+                intent_analysis = self._normalize_intent(IntentAnalysis(**intent_analysis))
             
             # 3. If tools are needed, load and execute them
             if intent_analysis.required_tools:
-                tools = await self.tool_registry.load_tools_from_registry(intent_analysis.required_tools)
+                tools = await self._load_tools(intent_analysis.required_tools, prefetch)
+                # Dumped once and shared by planning and the context update
+                entities = intent_analysis.entities.model_dump()
                 
-                # 4. Create execution plan with structured output
-                plan = await self.create_execution_plan_enhanced(intent_analysis, tools)
+                # 4. Plan separately only if the combined call did not produce one
+                if plan is None:
+                    plan = await self.create_execution_plan_enhanced(intent_analysis, tools, entities)
                 
                 # 5. Execute the plan
                 results = await self.execute_plan(plan, tools)
                 
                 # 6. Update context
-                self._update_context_from_execution(conversation_id, intent_analysis, results)
+                self._update_context_from_execution(conversation_id, intent_analysis, results, entities, context)
                 
                 # 7. Format response - pass the original query context
                 response = await self.format_response(results, intent_analysis, query)
             else:
                 # No tools needed - return a direct response
+                prefetch.cancel()
                 response = self._get_no_tools_response(intent_analysis)
                 results = {"no_tools_used": True}
             
@@ -414,65 +631,204 @@ class EnhancedGenesisAgent:
             }
     
     async def execute_plan(self, plan: ExecutionPlan, tools: Dict[str, Any]) -> Dict[str, Any]:
-        """Execute the plan steps sequentially."""
+        """Execute the plan, running each step as soon as the steps it references have finished.
+        
+        Steps without "$steps.N" references in their parameters run concurrently; results
+        are reported in plan order.
+        """
+        steps = {index: step for index, step in enumerate(plan.steps) if tools.get(step.tool_name)}
+        # Parameters are scanned for references once per step; running a step only visits those
+        refs = {index: self._step_refs(index, step) for index, step in steps.items()}
+        waiting = {index: {ref[1] for ref in refs[index]} for index in steps}
+        outputs = {}  # Step index -> result of a successful step
+        entries = {}  # Step index -> steps_executed entry
+        running = {}  # Task -> step index
+        
+        try:
+            while waiting or running:
+                # Start every step whose dependencies have all finished
+                for index, deps in list(waiting.items()):
+                    # A referenced step whose tool did not load never runs, so its references cannot resolve
+                    missing = sorted(deps - steps.keys())
+                    if not missing and not deps.issubset(entries):
+                        continue
+                    del waiting[index]
+                    step = steps[index]
+                    if missing:
+                        entries[index] = {"tool": step.tool_name, "error": f"Skipped because step {missing[0]} has no loaded tool"}
+                        continue
+                    failed = sorted(deps - outputs.keys())
+                    if failed:
+                        entries[index] = {"tool": step.tool_name, "error": f"Skipped because step {failed[0]} failed"}
+                        continue
+                    task = asyncio.create_task(self._run_step(step, tools[step.tool_name], outputs, refs[index]))
+                    running[task] = index
+                if not running:
+                    continue
+                
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    index = running.pop(task)
+                    step = steps[index]
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        logger.error(f"Error executing {step.tool_name}: {e}")
+                        entries[index] = {"tool": step.tool_name, "error": str(e)}
+                        continue
+                    if not step.vectorize_over:
+                        outputs[index] = result
+                        entries[index] = {"tool": step.tool_name, "result": result}
+                        continue
+                    # A vectorized step reports one entry per item; it only counts as done if all succeeded
+                    entries[index] = []
+                    for item in result:
+                        if isinstance(item, Exception):
+                            logger.error(f"Error executing {step.tool_name}: {item}")
+                            entries[index].append({"tool": step.tool_name, "error": str(item)})
+                        else:
+                            entries[index].append({"tool": step.tool_name, "result": item})
+                    if not any(isinstance(item, Exception) for item in result):
+                        outputs[index] = result
+        finally:
+            for task in running:
+                task.cancel()
+        
         results = {
             "steps_executed": [],
             "final_results": {}
         }
-        
-        for step in plan.steps:
-            try:
-                tool = tools.get(step.tool_name)
-                if tool:
-                    # Transform parameters based on tool requirements
-                    logger.debug(f"Original parameters for {step.tool_name}: {step.parameters}")
-                    transformed_params = self._transform_parameters_for_tool(
-                        step.tool_name, 
-                        step.parameters,
-                        tool
-                    )
-                    logger.debug(f"Transformed parameters for {step.tool_name}: {transformed_params}")
-                    
-                    # Handle both RemoteTool objects and dict-based tools
-                    if hasattr(tool, 'execute'):
-                        step_result = await tool.execute(**transformed_params)
-                    elif isinstance(tool, dict) and callable(tool.get('execute')):
-                        step_result = await tool['execute'](**transformed_params)
-                    else:
-                        raise ValueError(f"Tool {step.tool_name} has no execute method")
-                    results["steps_executed"].append({
-                        "tool": step.tool_name,
-                        "result": step_result
-                    })
-                    results["final_results"][step.tool_name] = step_result
-            except Exception as e:
-                logger.error(f"Error executing {step.tool_name}: {e}")
-                results["steps_executed"].append({
-                    "tool": step.tool_name,
-                    "error": str(e)
-                })
+        for index in sorted(entries):
+            if not isinstance(entries[index], list):
+                results["steps_executed"].append(entries[index])
+                if "result" in entries[index]:
+                    results["final_results"][entries[index]["tool"]] = entries[index]["result"]
+                continue
+            # A vectorized step keeps the result of every item that succeeded, in item order
+            results["steps_executed"].extend(entries[index])
+            item_results = [entry["result"] for entry in entries[index] if "result" in entry]
+            if item_results:
+                results["final_results"][steps[index].tool_name] = item_results
         
         return results
     
-    def _update_context_from_execution(self, conversation_id: str, intent: IntentAnalysis, results: Dict[str, Any]):
+    async def _run_step(self, step: ToolParameters, tool: Any, outputs: Dict[int, Any], refs: List[Tuple[Tuple[Any, ...], int, List[str]]]) -> Any:
+        """Execute one plan step, bounded by the agent's tool concurrency limit."""
+        parameters = self._resolve_step_refs(step.parameters, refs, outputs)
+        if step.vectorize_over:
+            values = parameters.get(step.vectorize_over)
+            if not isinstance(values, list):
+                values = [values]
+            return await self._vectorized_execute(
+                step.tool_name, tool, [{**parameters, step.vectorize_over: value} for value in values]
+            )
+        return await self._execute_tool(step.tool_name, tool, parameters)
+    
+    async def _vectorized_execute(self, tool_name: str, tool: Any, param_array: List[Dict[str, Any]]) -> List[Any]:
+        """Run a tool once per parameter set concurrently; failed calls are returned as their exceptions."""
+        return await asyncio.gather(
+            *(self._execute_tool(tool_name, tool, params) for params in param_array),
+            return_exceptions=True
+        )
+    
+    async def _execute_tool(self, tool_name: str, tool: Any, parameters: Dict[str, Any]) -> Any:
+        """Call a tool with parameters transformed to what it expects."""
+        # Transform parameters based on tool requirements (logged by the transform)
+        transformed_params = self._transform_parameters_for_tool(
+            tool_name, 
+            parameters,
+            tool
+        )
+        
+        async with self._tool_semaphore:
+            # Handle both RemoteTool objects and dict-based tools
+            if hasattr(tool, 'execute'):
+                return await tool.execute(**transformed_params)
+            elif isinstance(tool, dict) and callable(tool.get('execute')):
+                return await tool['execute'](**transformed_params)
+            else:
+                raise ValueError(f"Tool {tool_name} has no execute method")
+    
+    def _step_refs(self, index: int, step: ToolParameters) -> List[Tuple[Tuple[Any, ...], int, List[str]]]:
+        """Find a step's "$steps.N.path" references to earlier steps.
+        
+        Each is (location in the parameters as a key/index path, referenced step, path into its result).
+        """
+        refs = []
+        stack = [((key,), value) for key, value in step.parameters.items()]
+        while stack:
+            location, value = stack.pop()
+            if isinstance(value, str):
+                match = _STEP_REF.match(value)
+                # Only earlier steps count, so references can never form a cycle
+                if match and int(match.group(1)) < index:
+                    path = match.group(2).split(".") if match.group(2) else []
+                    refs.append((location, int(match.group(1)), path))
+            elif isinstance(value, list):
+                stack.extend((location + (i,), item) for i, item in enumerate(value))
+            elif isinstance(value, dict):
+                stack.extend((location + (key,), item) for key, item in value.items())
+        return refs
+    
+    def _resolve_step_refs(self, parameters: Dict[str, Any], refs: List[Tuple[Tuple[Any, ...], int, List[str]]], outputs: Dict[int, Any]) -> Dict[str, Any]:
+        """Replace a step's references with values from finished step results.
+        
+        Only the containers on the way to a reference are copied; parameters without
+        references are returned as is.
+        """
+        if not refs:
+            return parameters
+        
+        resolved = dict(parameters)
+        copied = {id(resolved)}
+        for location, step_index, path in refs:
+            if step_index not in outputs:
+                continue
+            value = outputs[step_index]
+            for part in path:
+                value = value[int(part)] if isinstance(value, list) else value[part]
+            
+            target = resolved
+            for key in location[:-1]:
+                child = target[key]
+                if id(child) not in copied:
+                    child = target[key] = list(child) if isinstance(child, list) else dict(child)
+                    copied.add(id(child))
+                target = child
+            target[location[-1]] = value
+        return resolved
+    
+    def _update_context_from_execution(self, conversation_id: str, intent: IntentAnalysis, results: Dict[str, Any], entities: Optional[Dict[str, Any]] = None, context: Optional[Dict[str, Any]] = None):
         """Update context manager with execution details."""
-        self.context_manager.add_message(conversation_id, {
-            "type": "execution",
-            "intent": intent.intent,
-            "entities": intent.entities.dict(),
-            "tools_used": intent.required_tools,
-            "timestamp": datetime.now().isoformat()
-        })
-        
-        # Update entity tracking
-        for symbol in intent.entities.symbols:
-            self.context_manager.track_entity(conversation_id, "stock", symbol)
+        # Message and entity tracking share one write, reusing the context loaded for the request
+        self.context_manager.track_execution(
+            conversation_id,
+            {
+                "type": "execution",
+                "intent": intent.intent,
+                "entities": entities if entities is not None else intent.entities.model_dump(),
+                "tools_used": intent.required_tools
+            },
+            [("stock", symbol) for symbol in intent.entities.symbols],
+            existing_context=context
+        )
     
     async def format_response(self, results: Dict[str, Any], intent: IntentAnalysis, original_query: str = None) -> str:
         """Format the execution results into a user-friendly response."""
         if results.get("no_tools_used"):
             return results.get("response", "I can help you with stock analysis.")
         
+        response_parts, needs_llm_formatting = self._collect_response_parts(results)
+        
+        # If all tools provided formatting, return the combined response
+        if not needs_llm_formatting:
+            return "\n\n".join(response_parts)
+        
+        # Otherwise, use LLM to format the response
+        return await self._format_with_llm(response_parts, original_query)
+    
+    def _collect_response_parts(self, results: Dict[str, Any]) -> Tuple[List[str], bool]:
+        """Get the per-step response text and whether any step needs the LLM to format it."""
         # Build response from results
         response_parts = []
         needs_llm_formatting = False
@@ -489,14 +845,9 @@ class EnhancedGenesisAgent:
                 else:
                     # Tool didn't provide formatting, we'll need LLM help
                     needs_llm_formatting = True
-                    response_parts.append(json.dumps(result, indent=2))
-        
-        # If all tools provided formatting, return the combined response
-        if not needs_llm_formatting:
-            return "\n\n".join(response_parts)
+                    response_parts.append(orjson.dumps(result, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS).decode())
         
-        # Otherwise, use LLM to format the response
-        return await self._format_with_llm(response_parts, original_query)
+        return response_parts, needs_llm_formatting
     
     def _get_no_tools_response(self, intent: IntentAnalysis) -> str:
         """Generate response when no tools are needed."""
@@ -510,7 +861,17 @@ class EnhancedGenesisAgent:
     
     async def _format_with_llm(self, response_parts: List[str], original_query: str) -> str:
         """Use LLM to format complex responses when tools don't provide formatting."""
-        formatting_prompt = f"""
+        try:
+            response = await self.llm_adapter.llm.ainvoke(self._formatting_prompt(response_parts, original_query))
+            return response.content if hasattr(response, 'content') else str(response)
+        except Exception as e:
+            logger.warning(f"LLM formatting failed: {e}")
+            # Fallback to basic formatting
+            return "\n\n".join(response_parts)
+    
+    def _formatting_prompt(self, response_parts: List[str], original_query: str) -> str:
+        """Build the prompt that asks the LLM to turn raw tool results into a response."""
+        return f"""
         The user asked: "{original_query}"
         
         Here are the results from various tools:
@@ -519,43 +880,78 @@ class EnhancedGenesisAgent:
         Please format this information into a clear, human-readable response for the user.
         Focus on the key information they asked for, and present it in a conversational way.
         """
-        
-        try:
-            response = await self.llm_adapter.llm.ainvoke(formatting_prompt)
-            return response.content if hasattr(response, 'content') else str(response)
-        except Exception as e:
-            logger.warning(f"LLM formatting failed: {e}")
-            # Fallback to basic formatting
-            return "\n\n".join(response_parts)
     
     async def process_request_stream(self, query: str, conversation_id: str):
-        """Process request with streaming support."""
+        """Process request with streaming support.
+        
+        Yields status events while intent analysis and tools run, then the response as it is
+        generated in small frames, so the client sees output before the full response is ready.
+        """
         try:
-            # For now, process the full request and yield it in chunks
-            result = await self.process_request(query, conversation_id)
+            context = self.context_manager.get_context(conversation_id)
+            context['conversation_id'] = conversation_id
             
-            # Yield the response in chunks
-            response_text = result.get("response", "")
-            chunk_size = 50  # Characters per chunk
+            yield {"type": "status", "status": "analyzing"}
+            intent_analysis, plan, prefetch = await self._analyze_request(query, context)
             
-            for i in range(0, len(response_text), chunk_size):
-                chunk = response_text[i:i + chunk_size]
+            if intent_analysis.required_tools:
+                tools = await self._load_tools(intent_analysis.required_tools, prefetch)
+                entities = intent_analysis.entities.model_dump()
+                if plan is None:
+                    plan = await self.create_execution_plan_enhanced(intent_analysis, tools, entities)
+                
+                yield {"type": "status", "status": "executing", "tools": [step.tool_name for step in plan.steps]}
+                results = await self.execute_plan(plan, tools)
+                self._update_context_from_execution(conversation_id, intent_analysis, results, entities, context)
+                
+                yield {"type": "status", "status": "formatting"}
+                # The LLM stream is read on its own task, so a slow client does not hold up generation
+                async for frame in frame_stream(coalesce_stream(self._stream_response(results, query))):
+                    yield {
+                        "type": "content",
+                        "content": frame
+                    }
+            else:
+                prefetch.cancel()
                 yield {
                     "type": "content",
-                    "content": chunk
+                    "content": self._get_no_tools_response(intent_analysis)
                 }
-                await asyncio.sleep(0.01)  # Small delay for streaming effect
             
             # Yield metadata at the end
-            if "metadata" in result:
-                yield {
-                    "type": "metadata",
-                    "metadata": result["metadata"]
+            yield {
+                "type": "metadata",
+                "metadata": {
+                    "intent": intent_analysis.intent,
+                    "confidence": intent_analysis.confidence,
+                    "tools_used": intent_analysis.required_tools,
+                    "execution_time": datetime.now().isoformat()
                 }
+            }
                 
         except Exception as e:
             logger.error(f"Error in streaming: {e}")
             yield {
                 "type": "error",
                 "error": str(e)
-            }
\ No newline at end of file
+            }
+    
+    async def _stream_response(self, results: Dict[str, Any], original_query: str):
+        """Stream the formatted response, token by token when the LLM has to format it."""
+        response_parts, needs_llm_formatting = self._collect_response_parts(results)
+        if not needs_llm_formatting:
+            yield "\n\n".join(response_parts)
+            return
+        
+        streamed = False
+        try:
+            async for chunk in self.llm_adapter.llm.astream(self._formatting_prompt(response_parts, original_query)):
+                text = chunk.content if hasattr(chunk, 'content') else str(chunk)
+                if text:
+                    streamed = True
+                    yield text
+        except Exception as e:
+            logger.warning(f"LLM formatting failed: {e}")
+            # Fallback to basic formatting, unless part of the response already went out
+            if not streamed:
+                yield "\n\n".join(response_parts)
\ No newline at end of file
@@ -0,0 +1,77 @@
+from typing import List, Optional, Tuple
+from dataclasses import dataclass
+import re
+
+# One alternation of every routing keyword; the named group that matched is the intent
+_INTENT_KEYWORDS = re.compile(
+    r"\b(?:(?P<analyze_stock>price|quote)"
+    r"|(?P<technical_analysis>rsi|macd|sma|ema|bollinger|stochastic)"
+    r"|(?P<fundamental_analysis>fundamentals?|earnings|valuation)"
+    r"|(?P<compare_stocks>compare|vs|versus))\b",
+    re.I
+)
+# Words that need the conversation or the LLM to interpret: references to earlier turns,
+# time expressions that must be turned into a period, and anything with a number in it
+_NEEDS_LLM = re.compile(
+    r"\b(?:it|its|they|them|their|that|this|those|these|same|also|else"
+    r"|day|days|week|weeks|month|months|year|years|ytd|since|ago|last|past|history|historical)\b|\d",
+    re.I
+)
+_SYMBOL = re.compile(r"\b[A-Z]{1,5}\b")
+# Uppercase words that are not tickers
+_NOT_SYMBOLS = frozenset({"I", "A", "VS", "RSI", "MACD", "SMA", "EMA", "PE", "EPS", "ETF", "USD", "CEO", "AI", "OK"})
+MAX_ROUTED_WORDS = 8  # Longer queries usually carry nuance only the LLM picks up
+
+# Period each routed intent is analyzed over
+_INTENT_PERIODS = {
+    "analyze_stock": "1d",
+    "technical_analysis": "3mo",
+    "fundamental_analysis": "1mo",
+    "compare_stocks": "1mo",
+}
+
+@dataclass(slots=True)
+class RoutedQuery:
+    """Intent and entities of a query the router recognized."""
+    intent: str
+    symbols: List[str]
+    time_period: str
+    indicators: List[str]
+
+class FastRouter:
+    """Keyword router for simple "<keyword> <TICKER>" queries, so they skip the intent LLM call.
+    
+    A query is only routed when it names its tickers in uppercase, asks for exactly one kind
+    of analysis and has nothing that depends on the conversation or needs a date worked out;
+    everything else returns None and goes to the LLM.
+    """
+    
+    def try_match(self, query: str) -> Optional[RoutedQuery]:
+        """Route a query locally, or return None if the LLM should analyze it."""
+        if len(query.split()) > MAX_ROUTED_WORDS or _NEEDS_LLM.search(query):
+            return None
+        
+        symbols = list(dict.fromkeys(s for s in _SYMBOL.findall(query) if s not in _NOT_SYMBOLS))
+        intent, keywords = self._match_intent(query)
+        if intent is None or not symbols:
+            return None
+        
+        # Comparisons need two tickers; the other intents are planned for a single one
+        if intent == "compare_stocks" and len(symbols) < 2:
+            return None
+        if intent in ("technical_analysis", "fundamental_analysis") and len(symbols) > 1:
+            return None
+        
+        indicators = [k.lower() for k in keywords] if intent == "technical_analysis" else []
+        return RoutedQuery(intent, symbols, _INTENT_PERIODS[intent], indicators)
+    
+    def _match_intent(self, query: str) -> Tuple[Optional[str], List[str]]:
+        """Get the single intent the query's keywords point to, and the keywords matched."""
+        intent = None
+        keywords = []
+        for match in _INTENT_KEYWORDS.finditer(query):
+            if intent is not None and match.lastgroup != intent:
+                return None, []
+            intent = match.lastgroup
+            keywords.append(match.group())
+        return intent, keywords
\ No newline at end of file
@@ -1,7 +1,13 @@
 import os
-from typing import Any, Dict, Optional, AsyncGenerator
+from typing import Any, Dict, List, Optional, Tuple, AsyncGenerator
 from abc import ABC, abstractmethod
 import asyncio
+import hashlib
+import logging
+import threading
+
+import orjson
+from cachetools import TTLCache
 
 import openai
 from anthropic import AsyncAnthropic
@@ -9,6 +15,51 @@ from langchain.llms.base import LLM
 from langchain_openai import ChatOpenAI
 from langchain.callbacks.manager import CallbackManagerForLLMRun
 
+from agent.client_context import ClientContext
+from agent.stream_frames import coalesce_stream
+
+logger = logging.getLogger(__name__)
+
+# Completions at or below this temperature are treated as deterministic and cached
+CACHEABLE_TEMPERATURE = 0.3
+RESPONSE_CACHE_TTL = 3600
+
+# Structured routing calls (tool selection, intent, planning) run on a small model at
+# temperature 0 with a fixed seed; free-text formatting stays on the provider's large model
+ROUTING_MODELS = {"openai": "gpt-4o-mini", "claude": "claude-3-haiku-20240307"}
+ROUTING_SEED = 42
+
+# Structured-output schemas by name, registered by the modules that parse the responses.
+# Calls passing schema=<name> get OpenAI's json_schema mode instead of plain JSON mode
+JSON_SCHEMAS: Dict[str, Dict[str, Any]] = {}
+
+# Marks the system prompt as an Anthropic prompt-cache breakpoint
+CACHE_CONTROL = {"type": "ephemeral"}
+# How LangChain renders a system and a human message for a plain-text LLM
+_SYSTEM_PREFIX = "System: "
+_HUMAN_SEPARATOR = "\nHuman: "
+
+# How long BatchingLLMAdapter waits for sibling requests, and the most it packs into one call
+BATCH_WINDOW_MS = 25
+BATCH_MAX = 8
+
+# Event loop on a daemon thread that runs the coroutines behind synchronous LangChain calls
+_background_loop: Optional[asyncio.AbstractEventLoop] = None
+_background_lock = threading.Lock()
+
+def _run_in_background(coro) -> Any:
+    """Run a coroutine on the shared background loop and block until it finishes.
+    
+    Works whether or not the calling thread has a running loop, and never creates a loop
+    per call. The coroutine must not use clients bound to another loop.
+    """
+    global _background_loop
+    with _background_lock:
+        if _background_loop is None:
+            _background_loop = asyncio.new_event_loop()
+            threading.Thread(target=_background_loop.run_forever, name="llm-sync-calls", daemon=True).start()
+    return asyncio.run_coroutine_threadsafe(coro, _background_loop).result()
+
 class LLMProvider(ABC):
     """Abstract base class for LLM providers."""
     
@@ -24,46 +75,72 @@ class OpenAIProvider(LLMProvider):
     """OpenAI provider implementation."""
     
     def __init__(self):
-        self.client = openai.AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.client = openai.AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            http_client=ClientContext.get_http_client()
+        )
     
     async def complete(self, prompt: str, **kwargs) -> str:
-        # Handle response_format parameter - convert 'json' to 'json_object'
-        response_format = kwargs.get("response_format", "text")
-        if response_format == "json":
-            response_format = "json_object"
-        
         response = await self.client.chat.completions.create(
             model=kwargs.get("model", "gpt-4-turbo-preview"),
-            messages=[{"role": "user", "content": prompt}],
+            messages=self._messages(prompt, kwargs),
             temperature=kwargs.get("temperature", 0.7),
-            response_format={"type": response_format}
+            response_format=self._response_format(kwargs),
+            seed=kwargs.get("seed", openai.NOT_GIVEN),
+            extra_body=self._cache_options(kwargs)
         )
         return response.choices[0].message.content
     
     async def complete_stream(self, prompt: str, **kwargs) -> AsyncGenerator[str, None]:
         stream = await self.client.chat.completions.create(
             model=kwargs.get("model", "gpt-4-turbo-preview"),
-            messages=[{"role": "user", "content": prompt}],
+            messages=self._messages(prompt, kwargs),
             temperature=kwargs.get("temperature", 0.7),
-            stream=True
+            response_format=self._response_format(kwargs),
+            seed=kwargs.get("seed", openai.NOT_GIVEN),
+            stream=True,
+            extra_body=self._cache_options(kwargs)
         )
         
         async for chunk in stream:
             if chunk.choices[0].delta.content:
                 yield chunk.choices[0].delta.content
+    
+    def _response_format(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        if kwargs.get("schema"):
+            return {"type": "json_schema", "json_schema": JSON_SCHEMAS[kwargs["schema"]]}
+        # Handle response_format parameter - convert 'json' to 'json_object'
+        response_format = kwargs.get("response_format", "text")
+        if response_format == "json":
+            response_format = "json_object"
+        return {"type": response_format}
+    
+    def _messages(self, prompt: str, kwargs: Dict[str, Any]) -> List[Dict[str, str]]:
+        """Put the static system prompt first, so requests share a cacheable prefix."""
+        messages = [{"role": "system", "content": kwargs["system"]}] if kwargs.get("system") else []
+        messages.append({"role": "user", "content": prompt})
+        return messages
+    
+    def _cache_options(self, kwargs: Dict[str, Any]) -> Optional[Dict[str, str]]:
+        # Requests with the same key are routed together, which raises the prefix-cache hit rate
+        return {"prompt_cache_key": kwargs["prompt_cache_key"]} if kwargs.get("prompt_cache_key") else None
 
 class ClaudeProvider(LLMProvider):
     """Claude provider implementation."""
     
     def __init__(self):
-        self.client = AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+        self.client = AsyncAnthropic(
+            api_key=os.getenv("ANTHROPIC_API_KEY"),
+            http_client=ClientContext.get_http_client()
+        )
     
     async def complete(self, prompt: str, **kwargs) -> str:
         response = await self.client.messages.create(
             model=kwargs.get("model", "claude-3-opus-20240229"),
             messages=[{"role": "user", "content": prompt}],
             temperature=kwargs.get("temperature", 0.7),
-            max_tokens=kwargs.get("max_tokens", 4096)
+            max_tokens=kwargs.get("max_tokens", 4096),
+            **_system_options(kwargs.get("system"))
         )
         return response.content[0].text
     
@@ -72,7 +149,8 @@ class ClaudeProvider(LLMProvider):
             model=kwargs.get("model", "claude-3-opus-20240229"),
             messages=[{"role": "user", "content": prompt}],
             temperature=kwargs.get("temperature", 0.7),
-            max_tokens=kwargs.get("max_tokens", 4096)
+            max_tokens=kwargs.get("max_tokens", 4096),
+            **_system_options(kwargs.get("system"))
         )
         
         async with stream as s:
@@ -80,13 +158,55 @@ class ClaudeProvider(LLMProvider):
                 if chunk.type == "content_block_delta":
                     yield chunk.delta.text
 
+def _system_options(system: Optional[str]) -> Dict[str, Any]:
+    """Send the static system prompt as a cache breakpoint, so its prefill is reused."""
+    if not system:
+        return {}
+    return {"system": [{"type": "text", "text": system, "cache_control": CACHE_CONTROL}]}
+
+def _split_system_message(prompt: str) -> Tuple[Optional[str], str]:
+    """Split the "System: ...\nHuman: ..." text LangChain makes of chat messages into system and user parts."""
+    if prompt.startswith(_SYSTEM_PREFIX):
+        system, separator, human = prompt[len(_SYSTEM_PREFIX):].partition(_HUMAN_SEPARATOR)
+        if separator:
+            return system, human
+    return None, prompt
+
 class LLMAdapter:
     """Unified interface for LLM providers with LangChain support."""
     
     def __init__(self, provider: str = "openai"):
-        self.provider_name = provider
-        self.provider = self._init_provider(provider)
-        self.llm = self._init_langchain_llm(provider)
+        # Clients per provider name, built on first use and kept for switching back; the
+        # LangChain models are keyed by (provider name, routing) and built on first access
+        self._providers: Dict[str, LLMProvider] = {}
+        self._langchain_llms: Dict[Tuple[str, bool], LLM] = {}
+        # The shared HTTP client they were built on; they are rebuilt once it is closed
+        self._http_client = ClientContext.get_http_client()
+        self._use_provider(provider)
+        # Exact prompts only: a near-duplicate prompt can name a different company
+        self.response_cache = TTLCache(maxsize=4096, ttl=RESPONSE_CACHE_TTL)
+        # Lookups of cacheable prompts, for judging whether the caches pay for themselves
+        self.cache_stats = {"hits": 0, "misses": 0}
+        # Cacheable completions being fetched, by cache key; identical prompts await the same call
+        self._inflight: Dict[bytes, asyncio.Task] = {}
+    
+    @property
+    def llm(self) -> LLM:
+        """LangChain model of the current provider, for structured output parsing and formatting."""
+        return self._langchain_llm(routing=False)
+    
+    @property
+    def routing_llm(self) -> LLM:
+        """LangChain model of the current provider for routing calls."""
+        return self._langchain_llm(routing=True)
+    
+    def _langchain_llm(self, routing: bool) -> LLM:
+        self._refresh_clients()
+        key = (self.provider_name, routing)
+        llm = self._langchain_llms.get(key)
+        if llm is None:
+            llm = self._langchain_llms[key] = self._init_langchain_llm(self.provider_name, routing)
+        return llm
     
     def _init_provider(self, provider: str) -> LLMProvider:
         if provider == "openai":
@@ -96,47 +216,236 @@ class LLMAdapter:
         else:
             raise ValueError(f"Unknown provider: {provider}")
     
-    def _init_langchain_llm(self, provider: str) -> LLM:
-        """Initialize LangChain LLM for structured output parsing."""
+    def _init_langchain_llm(self, provider: str, routing: bool = False) -> LLM:
+        """Initialize LangChain LLM for structured output parsing, or for routing calls if routing."""
         if provider == "openai":
+            # Async calls reuse the provider's client, and with it the shared HTTP/2 pool
+            if routing:
+                return ChatOpenAI(
+                    model_name=ROUTING_MODELS[provider],
+                    temperature=0,
+                    model_kwargs={"seed": ROUTING_SEED},
+                    openai_api_key=os.getenv("OPENAI_API_KEY"),
+                    async_client=self._providers[provider].client.chat.completions
+                )
             return ChatOpenAI(
                 model_name="gpt-4-turbo-preview",
                 temperature=0.7,
-                openai_api_key=os.getenv("OPENAI_API_KEY")
+                openai_api_key=os.getenv("OPENAI_API_KEY"),
+                async_client=self._providers[provider].client.chat.completions
             )
         elif provider == "claude":
             # For Claude, we'll create a custom LangChain wrapper
+            if routing:
+                return CustomClaudeLLM(model=ROUTING_MODELS[provider], temperature=0)
             return CustomClaudeLLM()
         else:
             raise ValueError(f"Unknown provider for LangChain: {provider}")
     
     async def complete(self, prompt: str, **kwargs) -> str:
-        """Complete a prompt and return the full response."""
-        return await self.provider.complete(prompt, **kwargs)
+        """Complete a prompt and return the full response.
+        
+        purpose="routing" runs the call on the routing model at temperature 0 with a fixed
+        seed, unless model, temperature or seed are passed explicitly.
+        """
+        self._refresh_clients()
+        kwargs = self.call_options(kwargs)
+        if kwargs.get("temperature", 0.7) > CACHEABLE_TEMPERATURE:
+            return await self.provider.complete(prompt, **kwargs)
+        
+        response = self.get_cached(prompt, kwargs)
+        if response is not None:
+            return response
+        
+        key = self._cache_key(prompt, kwargs)
+        inflight = self._inflight.get(key)
+        if inflight is None:
+            inflight = self._inflight[key] = asyncio.ensure_future(self._complete_and_cache(prompt, kwargs, key))
+            # Retrieve the error even if every caller was cancelled, so asyncio does not log it as unhandled
+            inflight.add_done_callback(lambda task: task.cancelled() or task.exception())
+        # Shielded so a caller that is cancelled does not cancel the call for the others
+        return await asyncio.shield(inflight)
+    
+    async def _complete_and_cache(self, prompt: str, kwargs: Dict[str, Any], key: bytes) -> str:
+        try:
+            response = await self.provider.complete(prompt, **kwargs)
+            self.cache_response(prompt, kwargs, response)
+            return response
+        finally:
+            del self._inflight[key]
+    
+    def get_cached(self, prompt: str, kwargs: Dict[str, Any]) -> Optional[str]:
+        """Get the cached response for this exact prompt and options."""
+        response = self.response_cache.get(self._cache_key(prompt, kwargs))
+        self.cache_stats["hits" if response is not None else "misses"] += 1
+        return response
+    
+    def cache_response(self, prompt: str, kwargs: Dict[str, Any], response: str):
+        """Cache a deterministic response for this exact prompt and options."""
+        self.response_cache[self._cache_key(prompt, kwargs)] = response
+    
+    def call_options(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """Fill in the model, temperature and seed for the call's purpose."""
+        if kwargs.get("purpose") != "routing":
+            return kwargs
+        options = {"model": ROUTING_MODELS[self.provider_name], "temperature": 0, "seed": ROUTING_SEED}
+        options.update(kwargs)
+        return options
+    
+    def _cache_scope(self, kwargs: Dict[str, Any]) -> str:
+        """Identify the options that affect the completion, including the system prompt."""
+        kwargs = self.call_options(kwargs)
+        system_hash = hashlib.blake2b(kwargs.get("system", "").encode(), digest_size=16).hexdigest()
+        return f"{self.provider_name}|{kwargs.get('model')}|{kwargs.get('temperature')}|{kwargs.get('seed')}|{kwargs.get('max_tokens')}|{kwargs.get('response_format', 'text')}|{kwargs.get('schema')}|{system_hash}"
+    
+    def _cache_key(self, prompt: str, kwargs: Dict[str, Any]) -> bytes:
+        """Hash the prompt and the options that affect the completion."""
+        return hashlib.blake2b(prompt.encode() + b"\0" + self._cache_scope(kwargs).encode()).digest()
     
     async def complete_stream(self, prompt: str, **kwargs) -> AsyncGenerator[str, None]:
-        """Complete a prompt and stream the response."""
-        async for chunk in self.provider.complete_stream(prompt, **kwargs):
+        """Complete a prompt and stream the response, joining chunks that arrive while the caller is busy."""
+        self._refresh_clients()
+        async for chunk in coalesce_stream(self.provider.complete_stream(prompt, **self.call_options(kwargs))):
             yield chunk
     
     def switch_provider(self, provider: str):
         """Switch to a different LLM provider."""
+        self._use_provider(provider)
+    
+    def _use_provider(self, provider: str):
+        if provider not in self._providers:
+            self._providers[provider] = self._init_provider(provider)
+        self.provider = self._providers[provider]
         self.provider_name = provider
-        self.provider = self._init_provider(provider)
-        self.llm = self._init_langchain_llm(provider)
+    
+    def _refresh_clients(self):
+        """Rebuild the provider clients and LangChain models if ClientContext closed their HTTP client."""
+        if not self._http_client.is_closed:
+            return
+        self._http_client = ClientContext.get_http_client()
+        self._providers.clear()
+        self._langchain_llms.clear()
+        self._use_provider(self.provider_name)
+
+class BatchingLLMAdapter:
+    """LLMAdapter wrapper that packs concurrent deterministic JSON completions into one call.
+    
+    Every subtask of a combined call is visible to the model while it answers the others, so
+    only calls that pass the same batch_key (a conversation id, say) and identical options,
+    system prompt included, are combined. Calls without a batch_key are never batched, and
+    neither are streamed completions, which go straight to the wrapped adapter.
+    """
+    
+    def __init__(self, adapter: LLMAdapter, window_ms: int = BATCH_WINDOW_MS, max_batch: int = BATCH_MAX):
+        self.adapter = adapter
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        # Queued calls by (batch_key, options)
+        self._pending: Dict[Tuple, List[Tuple[str, Dict[str, Any], asyncio.Future]]] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+    
+    def __getattr__(self, name: str) -> Any:
+        # Everything except complete() is served by the wrapped adapter
+        return getattr(self.adapter, name)
+    
+    async def complete(self, prompt: str, **kwargs) -> str:
+        """Complete a prompt, sharing one LLM call with calls of the same batch_key queued in the same window."""
+        batch_key = kwargs.pop("batch_key", None)
+        kwargs = self.adapter.call_options(kwargs)
+        if batch_key is None or kwargs.get("temperature", 0.7) > CACHEABLE_TEMPERATURE or kwargs.get("response_format") != "json":
+            return await self.adapter.complete(prompt, **kwargs)
+        
+        cached = self.adapter.get_cached(prompt, kwargs)
+        if cached is not None:
+            return cached
+        
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        batch = self._pending.setdefault((batch_key, tuple(sorted(kwargs.items()))), [])
+        batch.append((prompt, kwargs, future))
+        
+        if len(batch) >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush)
+        
+        return await future
+    
+    def _flush(self):
+        """Dispatch everything queued so far, one combined call per batch_key and set of options."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        
+        groups, self._pending = self._pending, {}
+        for batch in groups.values():
+            asyncio.ensure_future(self._run_batch(batch))
+    
+    async def _run_batch(self, batch: List[Tuple[str, Dict[str, Any], asyncio.Future]]):
+        """Issue one combined completion for the batch and resolve each caller's future."""
+        if len(batch) == 1:
+            # Low load: no siblings arrived within the window, so make the plain call
+            prompt, kwargs, future = batch[0]
+            await self._resolve(future, self.adapter.complete(prompt, **kwargs))
+            return
+        
+        kwargs = batch[0][1]
+        try:
+            # The combined answer has its own shape, so it is requested in plain JSON mode
+            combined_kwargs = {key: value for key, value in kwargs.items() if key != "schema"}
+            response = await self.adapter.complete(self._combine_prompts([p for p, _, _ in batch]), **combined_kwargs)
+            answers = orjson.loads(response)["answers"]
+            if len(answers) != len(batch):
+                raise ValueError(f"Expected {len(batch)} answers, got {len(answers)}")
+        except Exception as e:
+            logger.warning(f"Batched completion failed, falling back to individual calls: {e}")
+            await asyncio.gather(*(self._resolve(future, self.adapter.complete(prompt, **kwargs)) for prompt, kwargs, future in batch))
+            return
+        
+        for (prompt, kwargs, future), answer in zip(batch, answers):
+            text = orjson.dumps(answer).decode()
+            self.adapter.cache_response(prompt, kwargs, text)
+            if not future.done():
+                future.set_result(text)
+    
+    async def _resolve(self, future: asyncio.Future, completion):
+        try:
+            result = await completion
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(result)
+    
+    def _combine_prompts(self, prompts: List[str]) -> str:
+        subtasks = "\n\n".join(f"=== SUBTASK {i} ===\n{prompt.strip()}" for i, prompt in enumerate(prompts, 1))
+        return f"""The following {len(prompts)} subtasks are independent. Answer each one on its own, following the instructions exactly, as if it were the only request.
+
+{subtasks}
+
+Return a JSON object of the form {{"answers": [...]}} where "answers" holds exactly {len(prompts)} JSON values, the answer to SUBTASK 1 first, in order.
+"""
 
 class CustomClaudeLLM(LLM):
     """Custom LangChain wrapper for Claude."""
     
     client: Optional[AsyncAnthropic] = None
+    # Separate client for sync calls; the shared HTTP pool belongs to the application's loop
+    sync_client: Optional[AsyncAnthropic] = None
+    model: str = "claude-3-opus-20240229"
+    temperature: float = 0.7
     
     @property
     def _llm_type(self) -> str:
         return "claude"
     
-    def __init__(self):
-        super().__init__()
-        self.client = AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.client = AsyncAnthropic(
+            api_key=os.getenv("ANTHROPIC_API_KEY"),
+            http_client=ClientContext.get_http_client()
+        )
     
     def _call(
         self,
@@ -145,14 +454,10 @@ class CustomClaudeLLM(LLM):
         run_manager: Optional[CallbackManagerForLLMRun] = None,
         **kwargs
     ) -> str:
-        """Synchronous call - convert async to sync."""
-        import asyncio
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            return loop.run_until_complete(self._acall(prompt, stop, run_manager, **kwargs))
-        finally:
-            loop.close()
+        """Synchronous call, run on the background loop."""
+        if self.sync_client is None:
+            self.sync_client = AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+        return _run_in_background(self._complete(self.sync_client, prompt, **kwargs))
     
     async def _acall(
         self,
@@ -162,10 +467,16 @@ class CustomClaudeLLM(LLM):
         **kwargs
     ) -> str:
         """Async call to Claude."""
-        response = await self.client.messages.create(
-            model=kwargs.get("model", "claude-3-opus-20240229"),
+        return await self._complete(self.client, prompt, **kwargs)
+    
+    async def _complete(self, client: AsyncAnthropic, prompt: str, **kwargs) -> str:
+        # Chat prompts arrive flattened; the system part goes back to the system field so it is cached
+        system, prompt = _split_system_message(prompt)
+        response = await client.messages.create(
+            model=kwargs.get("model", self.model),
             messages=[{"role": "user", "content": prompt}],
-            temperature=kwargs.get("temperature", 0.7),
-            max_tokens=kwargs.get("max_tokens", 4096)
+            temperature=kwargs.get("temperature", self.temperature),
+            max_tokens=kwargs.get("max_tokens", 4096),
+            **_system_options(system)
         )
         return response.content[0].text
\ No newline at end of file
@@ -0,0 +1,38 @@
+from typing import Any, Optional
+import hashlib
+import re
+
+from cachetools import LRUCache
+
+# Words that do not change what a query asks for, dropped before matching
+_FILLER_WORDS = frozenset({
+    "please", "pls", "thanks", "thank", "you", "can", "could", "would", "me", "i", "want",
+    "to", "the", "a", "an", "for", "of", "show", "give", "tell", "let", "see", "some",
+})
+_WORD = re.compile(r"[a-z0-9]+")
+
+def _normalize(query: str) -> str:
+    return " ".join(word for word in _WORD.findall(query.lower()) if word not in _FILLER_WORDS)
+
+class QueryCache:
+    """LRU cache of values keyed by normalized query text and a scope.
+    
+    Queries match when they have the same words apart from case, punctuation and filler
+    words, so "Show me AAPL price please" reuses the entry for "AAPL price". There is no
+    similarity matching: queries one word apart ("netflix"/"netapp", "quarterly"/"annual")
+    often ask for something else.
+    """
+    
+    def __init__(self, maxsize: int = 512):
+        self.entries = LRUCache(maxsize=maxsize)
+    
+    def get(self, query: str, scope: str = "") -> Optional[Any]:
+        """Get the value cached for this query, or None."""
+        return self.entries.get(self._key(query, scope))
+    
+    def put(self, query: str, value: Any, scope: str = ""):
+        """Cache a value for a query."""
+        self.entries[self._key(query, scope)] = value
+    
+    def _key(self, query: str, scope: str) -> bytes:
+        return hashlib.blake2b(_normalize(query).encode() + b"\0" + scope.encode()).digest()
\ No newline at end of file
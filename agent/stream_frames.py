@@ -0,0 +1,66 @@
+from typing import AsyncIterator, List
+import asyncio
+import time
+
+STREAM_FRAME_CHARS = 50  # Roughly a dozen tokens per frame sent to the client
+STREAM_FRAME_INTERVAL = 0.02  # Seconds; a slow stream still sends what it has this often
+
+_END = object()  # Queued after a stream's last chunk
+
+async def frame_stream(
+    chunks: AsyncIterator[str],
+    frame_chars: int = STREAM_FRAME_CHARS,
+    frame_interval: float = STREAM_FRAME_INTERVAL
+) -> AsyncIterator[str]:
+    """Regroup a token stream into frames of about frame_chars characters.
+    
+    Each frame is one event downstream instead of one per token. The interval is checked as
+    tokens arrive, so a frame never waits on a token that has not been generated yet.
+    """
+    buffer: List[str] = []
+    size = 0
+    flushed_at = time.monotonic()
+    async for chunk in chunks:
+        buffer.append(chunk)
+        size += len(chunk)
+        now = time.monotonic()
+        if size >= frame_chars or now - flushed_at >= frame_interval:
+            yield "".join(buffer)
+            buffer.clear()
+            size = 0
+            flushed_at = now
+    if buffer:
+        yield "".join(buffer)
+
+async def coalesce_stream(chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+    """Yield everything a stream produced since the previous yield as one string.
+    
+    A task reads the stream into a queue, so chunks that arrive while the consumer is busy
+    are joined into one item instead of each taking a trip through the generator chain.
+    Errors from the stream are raised after the chunks read before them.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    
+    async def drain():
+        try:
+            async for chunk in chunks:
+                queue.put_nowait(chunk)
+        finally:
+            queue.put_nowait(_END)
+    
+    producer = asyncio.create_task(drain())
+    try:
+        while True:
+            parts = [await queue.get()]
+            while not queue.empty():
+                parts.append(queue.get_nowait())
+            done = parts[-1] is _END
+            if done:
+                parts.pop()
+            if parts:
+                yield "".join(parts)
+            if done:
+                break
+        await producer
+    finally:
+        producer.cancel()
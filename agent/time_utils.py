@@ -0,0 +1,16 @@
+import time
+from datetime import datetime, timezone
+
+# (epoch second, ISO string) of the last formatted timestamp
+_ts_cache = [0, ""]
+
+def now_iso() -> str:
+    """Current UTC time as an ISO 8601 string at one-second resolution.
+
+    The string is only reformatted when the second changes, so hot paths that
+    stamp metadata pay for an int(time.time()) and a list lookup.
+    """
+    t = int(time.time())
+    if t != _ts_cache[0]:
+        _ts_cache[:] = [t, datetime.fromtimestamp(t, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")]
+    return _ts_cache[1]
\ No newline at end of file
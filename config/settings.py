@@ -1,6 +1,7 @@
 import os
+from functools import lru_cache
 from typing import Optional
-from pydantic import BaseSettings
+from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
     # LLM Configuration
@@ -22,7 +23,12 @@ class Settings(BaseSettings):
     # Frontend Configuration
     frontend_url: str = "http://localhost:3000"
     
-    class Config:
-        env_file = ".env"
+    # Other variables in .env are ignored, as they were under pydantic v1
+    model_config = SettingsConfigDict(env_file=".env", extra="ignore")
 
-settings = Settings()
\ No newline at end of file
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Get the settings, reading the environment and .env only on the first call."""
+    return Settings()
+
+settings = get_settings()
\ No newline at end of file
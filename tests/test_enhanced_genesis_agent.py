@@ -0,0 +1,147 @@
+"""
+Tests for EnhancedGenesisAgent plan execution.
+
+Tools are replaced by fakes that record their calls, so no MCP calls are made.
+"""
+
+import asyncio
+import pytest
+from agent.enhanced_genesis_agent import EnhancedGenesisAgent, ExecutionPlan, ToolParameters, IntentAnalysis, StockEntity
+
+class FakeTool:
+    """Tool that records its calls and returns its parameters, or raises if it is set to fail."""
+    
+    def __init__(self, calls: list, fail: bool = False):
+        self.calls = calls
+        self.fail = fail
+    
+    async def execute(self, **kwargs):
+        await asyncio.sleep(0)
+        self.calls.append(kwargs)
+        if self.fail:
+            raise RuntimeError("tool failed")
+        return {"price": 10, "params": kwargs}
+
+@pytest.fixture
+def agent(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    return EnhancedGenesisAgent()
+
+def make_plan(*steps):
+    return ExecutionPlan(
+        description="test plan",
+        steps=[ToolParameters(tool_name=tool_name, parameters=parameters) for tool_name, parameters in steps]
+    )
+
+class TestExecutePlan:
+    """Steps run after the steps they reference, and are skipped if those did not succeed."""
+    
+    @pytest.mark.asyncio
+    async def test_step_runs_with_results_of_referenced_steps(self, agent):
+        calls = []
+        tools = {"price_tool": FakeTool(calls), "indicator_tool": FakeTool(calls)}
+        plan = make_plan(
+            ("price_tool", {"symbol": "AAPL"}),
+            ("indicator_tool", {"price": "$steps.0.price", "options": {"ticker": "$steps.0.params.symbol"}}),
+        )
+        results = await agent.execute_plan(plan, tools)
+        
+        assert calls == [{"symbol": "AAPL"}, {"price": 10, "options": {"ticker": "AAPL"}}]
+        assert [entry["tool"] for entry in results["steps_executed"]] == ["price_tool", "indicator_tool"]
+        assert all("result" in entry for entry in results["steps_executed"])
+    
+    @pytest.mark.asyncio
+    async def test_step_referencing_failed_step_is_skipped(self, agent):
+        calls = []
+        tools = {"failing_tool": FakeTool(calls, fail=True), "indicator_tool": FakeTool(calls)}
+        plan = make_plan(
+            ("failing_tool", {"symbol": "AAPL"}),
+            ("indicator_tool", {"price": "$steps.0.price"}),
+        )
+        results = await agent.execute_plan(plan, tools)
+        
+        assert calls == [{"symbol": "AAPL"}]
+        assert results["steps_executed"] == [
+            {"tool": "failing_tool", "error": "tool failed"},
+            {"tool": "indicator_tool", "error": "Skipped because step 0 failed"},
+        ]
+    
+    @pytest.mark.asyncio
+    async def test_step_referencing_step_without_tool_is_skipped(self, agent):
+        calls = []
+        tools = {"price_tool": FakeTool(calls), "indicator_tool": FakeTool(calls)}
+        plan = make_plan(
+            ("price_tool", {"symbol": "AAPL"}),
+            ("missing_tool", {"symbol": "AAPL"}),
+            ("indicator_tool", {"price": "$steps.1.price"}),
+        )
+        results = await agent.execute_plan(plan, tools)
+        
+        assert calls == [{"symbol": "AAPL"}]
+        assert results["steps_executed"][-1] == {
+            "tool": "indicator_tool", "error": "Skipped because step 1 has no loaded tool"
+        }
+        assert results["final_results"] == {"price_tool": {"price": 10, "params": {"symbol": "AAPL"}}}
+    
+    @pytest.mark.asyncio
+    async def test_vectorized_step_keeps_every_item_result(self, agent):
+        calls = []
+        tools = {"price_tool": FakeTool(calls)}
+        plan = ExecutionPlan(description="test plan", steps=[
+            ToolParameters(tool_name="price_tool", parameters={"symbol": ["AAPL", "MSFT"]}, vectorize_over="symbol")
+        ])
+        results = await agent.execute_plan(plan, tools)
+        
+        assert len(results["steps_executed"]) == 2
+        assert results["final_results"] == {"price_tool": [
+            {"price": 10, "params": {"symbol": "AAPL"}},
+            {"price": 10, "params": {"symbol": "MSFT"}},
+        ]}
+
+class FakeRegistry:
+    """Tool registry that records the tools it was asked to load."""
+    
+    def __init__(self):
+        self.loaded = []
+    
+    async def load_tools_from_registry(self, tool_names):
+        self.loaded.append(list(tool_names))
+        return {}
+
+class TestAnalyzeRequest:
+    """Queries the fast router matches are planned locally; the rest go to the LLM."""
+    
+    @pytest.fixture
+    def llm_calls(self, agent):
+        calls = []
+        
+        async def analyze_and_plan(query, context):
+            calls.append(query)
+            intent = IntentAnalysis(
+                intent="analyze_stock", entities=StockEntity(symbols=["AAPL"]),
+                confidence=0.8, reasoning="from the LLM", required_tools=["stock_analyzer"]
+            )
+            return intent, None
+        
+        agent.analyze_and_plan = analyze_and_plan
+        agent.tool_registry = FakeRegistry()
+        return calls
+    
+    @pytest.mark.asyncio
+    async def test_routed_query_skips_the_llm(self, agent, llm_calls):
+        intent, plan, prefetch = await agent._analyze_request("RSI for TSLA", {})
+        await prefetch
+        
+        assert llm_calls == []
+        assert intent.intent == "technical_analysis"
+        assert intent.entities.symbols == ["TSLA"]
+        assert [step.tool_name for step in plan.steps] == intent.required_tools
+    
+    @pytest.mark.asyncio
+    async def test_unrouted_query_falls_back_to_the_llm(self, agent, llm_calls):
+        intent, plan, prefetch = await agent._analyze_request("how has apple been doing lately", {})
+        await prefetch
+        
+        assert llm_calls == ["how has apple been doing lately"]
+        assert intent.reasoning == "from the LLM"
+        assert plan is None
@@ -0,0 +1,36 @@
+"""
+Tests for the keyword router that lets simple queries skip the intent LLM call.
+"""
+
+import pytest
+from agent.fast_router import FastRouter, RoutedQuery
+
+@pytest.fixture
+def router():
+    return FastRouter()
+
+class TestFastRouter:
+    """Simple "<keyword> <TICKER>" queries are routed; anything else goes to the LLM."""
+    
+    @pytest.mark.parametrize("query,expected", [
+        ("price of AAPL", RoutedQuery("analyze_stock", ["AAPL"], "1d", [])),
+        ("RSI and MACD for TSLA", RoutedQuery("technical_analysis", ["TSLA"], "3mo", ["rsi", "macd"])),
+        ("NVDA earnings", RoutedQuery("fundamental_analysis", ["NVDA"], "1mo", [])),
+        ("compare AAPL vs MSFT", RoutedQuery("compare_stocks", ["AAPL", "MSFT"], "1mo", [])),
+        ("AAPL MSFT price", RoutedQuery("analyze_stock", ["AAPL", "MSFT"], "1d", [])),
+    ])
+    def test_simple_queries_are_routed(self, router, query, expected):
+        assert router.try_match(query) == expected
+    
+    @pytest.mark.parametrize("query", [
+        "price of apple",  # No uppercase ticker
+        "what about its price",  # Refers to an earlier turn
+        "AAPL price over the last 3 months",  # Time expression
+        "AAPL earnings and RSI",  # More than one kind of analysis
+        "compare AAPL",  # A comparison needs two tickers
+        "RSI for AAPL and MSFT",  # Technical analysis is planned for one ticker
+        "tell me something interesting about AAPL",  # No routing keyword
+        "please show me the current quote for AAPL right now",  # Too long
+    ])
+    def test_other_queries_go_to_the_llm(self, router, query):
+        assert router.try_match(query) is None
@@ -0,0 +1,87 @@
+"""
+Tests for the archived GenesisAgent's planning helpers.
+
+The LLM provider and tool registry are replaced by fakes, so no API or MCP calls are made.
+"""
+
+import asyncio
+import json
+import pytest
+from agent.archived.genesis_agent import GenesisAgent, PlanStep
+
+class FakeStreamingProvider:
+    """Provider that streams a plan selecting the tool named in the prompt."""
+    
+    def __init__(self):
+        self.completed = []
+        self.streamed = []
+    
+    async def complete(self, prompt: str, **kwargs) -> str:
+        self.completed.append(prompt)
+        return "{}"
+    
+    async def complete_stream(self, prompt: str, **kwargs):
+        self.streamed.append(prompt)
+        tool_id = "stock_data.get_price" if "price" in prompt else "technical.calculate_indicators"
+        response = json.dumps({"tools_to_use": [{"tool_key": "tool", "tool_id": tool_id}], "plan": []})
+        for i in range(0, len(response), 8):
+            await asyncio.sleep(0)
+            yield response[i:i + 8]
+
+@pytest.fixture
+def agent(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    agent = GenesisAgent()
+    agent.llm_adapter.adapter.provider = FakeStreamingProvider()
+    agent.prefetched = []
+    
+    async def get_tool(tool_id):
+        agent.prefetched.append(tool_id)
+    
+    agent.tool_registry.get_tool = get_tool
+    return agent
+
+class TestPlanAndSelect:
+    """plan_and_select streams its completion and is not batched."""
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_calls_stream_separately(self, agent):
+        analyses = await asyncio.gather(
+            agent.plan_and_select("AAPL price", agent.context_manager.get_context("conv-1")),
+            agent.plan_and_select("NVDA rsi", agent.context_manager.get_context("conv-2"))
+        )
+        await asyncio.gather(*agent._tool_prefetches)
+        
+        provider = agent.llm_adapter.adapter.provider
+        assert len(provider.streamed) == 2
+        assert provider.completed == []
+        assert [a.tools_to_use[0].tool_id for a in analyses] == ["stock_data.get_price", "technical.calculate_indicators"]
+        assert sorted(agent.prefetched) == ["stock_data.get_price", "technical.calculate_indicators"]
+
+def make_plan(*depends_on):
+    return [PlanStep(tool_id=f"tool_{i}", depends_on=deps) for i, deps in enumerate(depends_on)]
+
+class TestGroupByDependencies:
+    """Steps are grouped into levels that only depend on earlier levels."""
+    
+    def test_steps_are_grouped_by_level(self, agent):
+        plan = make_plan([], [], [0], [0, 1], [2, 3])
+        
+        assert agent._group_by_dependencies(plan) == [[0, 1], [2, 3], [4]]
+    
+    def test_out_of_range_and_repeated_dependencies_are_ignored(self, agent):
+        plan = make_plan([5, -1], [0, 0])
+        
+        assert agent._group_by_dependencies(plan) == [[0], [1]]
+    
+    def test_self_cycle_raises(self, agent):
+        plan = make_plan([], [1])
+        
+        with pytest.raises(ValueError, match=r"\[1\]"):
+            agent._group_by_dependencies(plan)
+    
+    def test_two_step_cycle_raises(self, agent):
+        plan = make_plan([], [2], [1], [0])
+        
+        with pytest.raises(ValueError, match=r"\[1, 2\]"):
+            agent._group_by_dependencies(plan)
@@ -0,0 +1,248 @@
+"""
+Tests for LLMAdapter response caching and request coalescing.
+
+The provider is replaced by a fake that records prompts, so no API calls are made.
+"""
+
+import asyncio
+import gc
+import json
+import re
+import pytest
+from agent.client_context import ClientContext
+from agent.llm_adapter import LLMAdapter, BatchingLLMAdapter
+from agent.archived.genesis_agent import _PLAN_AND_SELECT_TEMPLATE
+
+# Queries that differ only in the company they name
+SIMILAR_COMPANY_QUERIES = [
+    ("fundamental analysis for nvidia", "fundamental analysis for netflix"),
+    ("fundamental analysis for netapp", "fundamental analysis for netflix"),
+    ("fundamental analysis for microstrategy", "fundamental analysis for microsoft"),
+    ("fundamental analysis for amazon", "fundamental analysis for alphabet"),
+    ("fundamental analysis for salesforce", "fundamental analysis for microsoft"),
+]
+
+class FakeProvider:
+    """Provider that answers with the prompt it was given, or one answer per batched subtask."""
+    
+    def __init__(self):
+        self.prompts = []
+        self.systems = []
+    
+    async def complete(self, prompt: str, **kwargs) -> str:
+        self.prompts.append(prompt)
+        self.systems.append(kwargs.get("system"))
+        subtasks = re.findall(r"=== SUBTASK \d+ ===\n(.*)", prompt)
+        if subtasks:
+            return json.dumps({"answers": [{"prompt": subtask} for subtask in subtasks]})
+        return f"response to {prompt}"
+
+def plan_prompt(query: str) -> str:
+    return _PLAN_AND_SELECT_TEMPLATE.format_map({
+        "last_entity": "None",
+        "last_tool": "None",
+        "recent_entities": [],
+        "query": query
+    })
+
+@pytest.fixture
+def adapter(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    adapter = LLMAdapter()
+    adapter.provider = FakeProvider()
+    return adapter
+
+class TestResponseCache:
+    """Deterministic completions are reused only for the exact same prompt."""
+    
+    @pytest.mark.asyncio
+    async def test_exact_prompt_is_cached(self, adapter):
+        prompt = plan_prompt("fundamental analysis for nvidia")
+        first = await adapter.complete(prompt, temperature=0)
+        second = await adapter.complete(prompt, temperature=0)
+        
+        assert first == second
+        assert adapter.provider.prompts == [prompt]
+        assert adapter.cache_stats == {"hits": 1, "misses": 1}
+    
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("cached_query,query", SIMILAR_COMPANY_QUERIES)
+    async def test_similar_prompt_for_another_company_is_not_reused(self, adapter, cached_query, query):
+        await adapter.complete(plan_prompt(cached_query), temperature=0)
+        response = await adapter.complete(plan_prompt(query), temperature=0)
+        
+        assert response == f"response to {plan_prompt(query)}"
+        assert len(adapter.provider.prompts) == 2
+    
+    @pytest.mark.asyncio
+    async def test_sampled_completion_is_not_cached(self, adapter):
+        prompt = plan_prompt("fundamental analysis for nvidia")
+        await adapter.complete(prompt, temperature=0.7)
+        await adapter.complete(prompt, temperature=0.7)
+        
+        assert len(adapter.provider.prompts) == 2
+
+
+class GatedProvider:
+    """Provider whose completions wait until released, and fail if it is set to fail."""
+    
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.calls = 0
+        self.release = asyncio.Event()
+    
+    async def complete(self, prompt: str, **kwargs) -> str:
+        self.calls += 1
+        await self.release.wait()
+        if self.fail:
+            raise RuntimeError("provider failed")
+        return f"response to {prompt}"
+
+class TestInflightCoalescing:
+    """Identical cacheable prompts in flight at the same time share one provider call."""
+    
+    @pytest.mark.asyncio
+    async def test_identical_prompts_share_one_call(self, adapter):
+        adapter.provider = GatedProvider()
+        callers = [asyncio.ensure_future(adapter.complete("AAPL price", temperature=0)) for _ in range(3)]
+        await asyncio.sleep(0)
+        adapter.provider.release.set()
+        
+        assert await asyncio.gather(*callers) == ["response to AAPL price"] * 3
+        assert adapter.provider.calls == 1
+        assert adapter._inflight == {}
+    
+    @pytest.mark.asyncio
+    async def test_error_is_raised_to_every_waiter(self, adapter):
+        adapter.provider = GatedProvider(fail=True)
+        callers = [asyncio.ensure_future(adapter.complete("AAPL price", temperature=0)) for _ in range(2)]
+        await asyncio.sleep(0)
+        adapter.provider.release.set()
+        results = await asyncio.gather(*callers, return_exceptions=True)
+        
+        assert [str(result) for result in results] == ["provider failed"] * 2
+        assert adapter.provider.calls == 1
+        assert adapter._inflight == {}
+        
+        # The failure is not cached; the next call goes to the provider again
+        adapter.provider.fail = False
+        assert await adapter.complete("AAPL price", temperature=0) == "response to AAPL price"
+        assert adapter.provider.calls == 2
+    
+    @pytest.mark.asyncio
+    async def test_cancelled_caller_does_not_cancel_the_call(self, adapter):
+        adapter.provider = GatedProvider()
+        leader = asyncio.ensure_future(adapter.complete("AAPL price", temperature=0))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(adapter.complete("AAPL price", temperature=0))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        adapter.provider.release.set()
+        
+        assert await follower == "response to AAPL price"
+        assert leader.cancelled()
+        assert adapter.provider.calls == 1
+        assert await adapter.complete("AAPL price", temperature=0) == "response to AAPL price"
+        assert adapter.provider.calls == 1
+    
+    @pytest.mark.asyncio
+    async def test_error_after_every_caller_is_cancelled_is_retrieved(self, adapter):
+        adapter.provider = GatedProvider(fail=True)
+        errors = []
+        loop = asyncio.get_running_loop()
+        loop.set_exception_handler(lambda loop, context: errors.append(context))
+        caller = asyncio.ensure_future(adapter.complete("AAPL price", temperature=0))
+        await asyncio.sleep(0)
+        task = adapter._inflight[adapter._cache_key("AAPL price", {"temperature": 0})]
+        caller.cancel()
+        await asyncio.sleep(0)
+        adapter.provider.release.set()
+        await asyncio.wait([task])
+        del task
+        gc.collect()
+        
+        assert errors == []
+    
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("options", [{"seed": 1}, {"max_tokens": 10}])
+    async def test_calls_with_different_seed_or_max_tokens_are_not_shared(self, adapter, options):
+        adapter.provider = GatedProvider()
+        callers = [
+            asyncio.ensure_future(adapter.complete("AAPL price", temperature=0)),
+            asyncio.ensure_future(adapter.complete("AAPL price", temperature=0, **options)),
+        ]
+        await asyncio.sleep(0)
+        adapter.provider.release.set()
+        await asyncio.gather(*callers)
+        
+        assert adapter.provider.calls == 2
+
+
+class TestClientRefresh:
+    """Clients and models built on the shared HTTP client are rebuilt after it is closed."""
+    
+    @pytest.mark.asyncio
+    async def test_models_are_rebuilt_after_client_context_closes(self, adapter):
+        llm, routing_llm = adapter.llm, adapter.routing_llm
+        await ClientContext.aclose()
+        
+        assert adapter.llm is not llm
+        assert adapter.routing_llm is not routing_llm
+        assert adapter.provider is not None and not isinstance(adapter.provider, FakeProvider)
+        assert adapter._http_client is ClientContext.get_http_client()
+        assert not adapter._http_client.is_closed
+    
+    def test_models_are_kept_while_client_is_open(self, adapter):
+        assert adapter.llm is adapter.llm
+        assert adapter.routing_llm is adapter.routing_llm
+
+
+class TestBatchingLLMAdapter:
+    """Only calls with the same batch_key and options share a combined call."""
+    
+    @pytest.fixture
+    def batching(self, adapter):
+        return BatchingLLMAdapter(adapter)
+    
+    async def complete_all(self, batching, calls):
+        return await asyncio.gather(*(
+            batching.complete(prompt, temperature=0, response_format="json", **options) for prompt, options in calls
+        ))
+    
+    @pytest.mark.asyncio
+    async def test_same_batch_key_and_options_are_combined(self, batching, adapter):
+        responses = await self.complete_all(batching, [
+            ("plan AAPL", {"system": "plan", "batch_key": "conv-1"}),
+            ("plan MSFT", {"system": "plan", "batch_key": "conv-1"}),
+        ])
+        
+        assert [json.loads(r) for r in responses] == [{"prompt": "plan AAPL"}, {"prompt": "plan MSFT"}]
+        assert len(adapter.provider.prompts) == 1
+        assert adapter.provider.systems == ["plan"]
+    
+    @pytest.mark.asyncio
+    async def test_different_batch_keys_are_not_combined(self, batching, adapter):
+        await self.complete_all(batching, [
+            ("plan AAPL", {"system": "plan", "batch_key": "conv-1"}),
+            ("plan MSFT", {"system": "plan", "batch_key": "conv-2"}),
+        ])
+        
+        assert sorted(adapter.provider.prompts) == ["plan AAPL", "plan MSFT"]
+    
+    @pytest.mark.asyncio
+    async def test_different_system_prompts_are_not_combined(self, batching, adapter):
+        await self.complete_all(batching, [
+            ("plan AAPL", {"system": "plan", "batch_key": "conv-1"}),
+            ("plan MSFT", {"system": "select tools", "batch_key": "conv-1"}),
+        ])
+        
+        assert sorted(zip(adapter.provider.prompts, adapter.provider.systems)) == [
+            ("plan AAPL", "plan"), ("plan MSFT", "select tools")
+        ]
+    
+    @pytest.mark.asyncio
+    async def test_calls_without_batch_key_are_not_combined(self, batching, adapter):
+        await self.complete_all(batching, [("plan AAPL", {}), ("plan MSFT", {})])
+        
+        assert sorted(adapter.provider.prompts) == ["plan AAPL", "plan MSFT"]
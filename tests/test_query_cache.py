@@ -0,0 +1,51 @@
+"""
+Tests for the query cache used for intent analysis and plans.
+"""
+
+import pytest
+from agent.query_cache import QueryCache
+
+# Queries one word apart that ask for different things
+DIFFERENT_QUERIES = [
+    ("fundamental analysis for netapp", "fundamental analysis for netflix"),
+    ("fundamental analysis for microstrategy", "fundamental analysis for microsoft"),
+    ("how is amazon doing", "how is alphabet doing"),
+    ("show quarterly earnings for AAPL", "show annual earnings for AAPL"),
+    ("valuation of NVDA", "momentum of NVDA"),
+    ("analyze AAPL", "analyze MSFT"),
+]
+
+class TestQueryCache:
+    """Entries are reused for the same query words only."""
+    
+    def test_same_words_match(self):
+        cache = QueryCache()
+        cache.put("AAPL price", "cached")
+        
+        assert cache.get("Show me the AAPL price, please!") == "cached"
+        assert cache.get("aapl PRICE") == "cached"
+    
+    @pytest.mark.parametrize("cached_query,query", DIFFERENT_QUERIES)
+    def test_different_words_do_not_match(self, cached_query, query):
+        cache = QueryCache()
+        cache.put(cached_query, "cached")
+        
+        assert cache.get(query) is None
+    
+    def test_scope_is_part_of_the_key(self):
+        cache = QueryCache()
+        cache.put("how about its price", "about AAPL", scope="last_entity=AAPL")
+        
+        assert cache.get("how about its price", scope="last_entity=AAPL") == "about AAPL"
+        assert cache.get("how about its price", scope="last_entity=MSFT") is None
+    
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = QueryCache(maxsize=2)
+        cache.put("analyze AAPL", 1)
+        cache.put("analyze MSFT", 2)
+        cache.get("analyze AAPL")
+        cache.put("analyze NVDA", 3)
+        
+        assert cache.get("analyze MSFT") is None
+        assert cache.get("analyze AAPL") == 1
+        assert cache.get("analyze NVDA") == 3
@@ -0,0 +1,75 @@
+"""
+Tests for regrouping token streams into fewer, larger chunks.
+"""
+
+import asyncio
+import pytest
+from agent.stream_frames import frame_stream, coalesce_stream
+
+async def stream(chunks, error=None):
+    for chunk in chunks:
+        await asyncio.sleep(0)
+        yield chunk
+    if error is not None:
+        raise error
+
+async def collect(chunks):
+    return [chunk async for chunk in chunks]
+
+class TestFrameStream:
+    """Chunks are sent in frames of about frame_chars characters."""
+    
+    @pytest.mark.asyncio
+    async def test_frames_end_once_they_reach_frame_chars(self):
+        frames = await collect(frame_stream(stream(["ab", "cd", "e", "fgh", "i"]), frame_chars=4, frame_interval=60))
+        
+        assert frames == ["abcd", "efgh", "i"]
+    
+    @pytest.mark.asyncio
+    async def test_remainder_is_sent_when_stream_ends(self):
+        frames = await collect(frame_stream(stream(["a", "b"]), frame_chars=50, frame_interval=60))
+        
+        assert frames == ["ab"]
+    
+    @pytest.mark.asyncio
+    async def test_elapsed_interval_sends_a_short_frame(self):
+        frames = await collect(frame_stream(stream(["a", "b"]), frame_chars=50, frame_interval=0))
+        
+        assert frames == ["a", "b"]
+    
+    @pytest.mark.asyncio
+    async def test_empty_stream_sends_nothing(self):
+        assert await collect(frame_stream(stream([]))) == []
+
+class TestCoalesceStream:
+    """Chunks that arrive while the consumer is busy are joined into one."""
+    
+    @pytest.mark.asyncio
+    async def test_chunks_arriving_while_consumer_is_busy_are_joined(self):
+        received = []
+        async for chunk in coalesce_stream(stream(["a", "b", "c", "d"])):
+            received.append(chunk)
+            # Let the producer read the rest of the stream before the next item is taken
+            for _ in range(10):
+                await asyncio.sleep(0)
+        
+        assert received[0] == "a"
+        assert "".join(received) == "abcd"
+        assert len(received) < 4
+    
+    @pytest.mark.asyncio
+    async def test_chunks_read_before_the_end_are_flushed(self):
+        assert "".join(await collect(coalesce_stream(stream(["a", "b", "c"])))) == "abc"
+    
+    @pytest.mark.asyncio
+    async def test_empty_stream_yields_nothing(self):
+        assert await collect(coalesce_stream(stream([]))) == []
+    
+    @pytest.mark.asyncio
+    async def test_error_is_raised_after_the_chunks_before_it(self):
+        received = []
+        with pytest.raises(RuntimeError, match="stream failed"):
+            async for chunk in coalesce_stream(stream(["a", "b"], RuntimeError("stream failed"))):
+                received.append(chunk)
+        
+        assert "".join(received) == "ab"
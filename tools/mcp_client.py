@@ -1,9 +1,10 @@
 import asyncio
-import json
 from typing import Dict, Any, Optional
 import aiohttp
 import logging
 
+import orjson
+
 logger = logging.getLogger(__name__)
 
 class MCPClient:
@@ -44,15 +45,16 @@ class MCPClient:
         }
         
         try:
+            # Tool results can be large market-data payloads, so both directions go through orjson
             async with self.session.post(
                 self.base_url,
-                json=request,
+                data=orjson.dumps(request, option=orjson.OPT_SERIALIZE_NUMPY),
                 headers={"Content-Type": "application/json"}
             ) as response:
                 if response.status != 200:
                     raise Exception(f"HTTP error: {response.status}")
                 
-                result = await response.json()
+                result = orjson.loads(await response.read())
                 
                 if "error" in result:
                     raise Exception(f"MCP error: {result['error']}")
@@ -71,6 +73,8 @@ class MCPClient:
 class RemoteTool:
     """Wrapper for a remote tool accessed via MCP."""
     
+    __slots__ = ("tool_id", "connection", "metadata")
+    
     def __init__(self, tool_id: str, connection: MCPClient, metadata: Dict[str, Any]):
         self.tool_id = tool_id
         self.connection = connection
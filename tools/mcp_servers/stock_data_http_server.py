@@ -70,4 +70,4 @@ async def handle_mcp_request(request: ToolRequest) -> Dict[str, Any]:
         }
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=5001)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=5001, loop="asyncio" if sys.platform == "win32" else "uvloop")
\ No newline at end of file
@@ -5,6 +5,11 @@ This registry provides detailed metadata about each tool to help the agent
 make intelligent decisions about which tools to use based on user queries.
 """
 
+from collections import defaultdict
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Mapping, Tuple
+
 TOOL_REGISTRY = {
     "stock_analyzer": {
         "id": "stock_data.get_price",
@@ -140,10 +145,39 @@ CONTEXT_HINTS = {
     }
 }
 
+# Bumped whenever tools are registered or removed so cached prompt text is rebuilt
+_registry_version = 0
+
+def register_tool(tool_key: str, tool_info: dict):
+    """
+    Add or replace a tool in the registry.
+    """
+    global _registry_version
+    TOOL_REGISTRY[tool_key] = tool_info
+    _registry_version += 1
+
+def unregister_tool(tool_key: str):
+    """
+    Remove a tool from the registry.
+    """
+    global _registry_version
+    if TOOL_REGISTRY.pop(tool_key, None) is not None:
+        _registry_version += 1
+
+def get_registry_version() -> int:
+    """
+    Get the current registry version, which changes whenever the set of tools changes.
+    """
+    return _registry_version
+
 def get_tool_descriptions_for_prompt():
     """
     Generate a formatted string of tool descriptions for the agent's system prompt.
     """
+    return _build_tool_descriptions(_registry_version)
+
+@lru_cache(maxsize=1)
+def _build_tool_descriptions(registry_version: int) -> str:
     descriptions = []
     for tool_key, tool_info in TOOL_REGISTRY.items():
         desc = f"""
@@ -158,14 +192,25 @@ Requires: {', '.join(tool_info['requires'])}
     
     return "\n\n".join(descriptions)
 
+def get_category_index() -> Mapping[str, Tuple[str, ...]]:
+    """
+    Get the registry keys grouped by tool category, rebuilt only when the set of tools changes.
+    """
+    return _build_category_index(_registry_version)
+
+@lru_cache(maxsize=1)
+def _build_category_index(registry_version: int) -> Mapping[str, Tuple[str, ...]]:
+    index = defaultdict(list)
+    for key, tool in TOOL_REGISTRY.items():
+        if tool.get('category') is not None:
+            index[tool['category']].append(key)
+    return MappingProxyType({category: tuple(keys) for category, keys in index.items()})
+
 def get_tools_by_category(category: str):
     """
     Get all tools in a specific category.
     """
-    return {
-        key: tool for key, tool in TOOL_REGISTRY.items() 
-        if tool.get('category') == category
-    }
+    return {key: TOOL_REGISTRY[key] for key in get_category_index().get(category, ())}
 
 def match_tool_by_examples(query: str):
     """
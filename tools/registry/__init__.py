@@ -1,18 +1,26 @@
 # Import directly from the registry.py file to avoid circular imports
 import importlib.util
 import os
+import sys
 
-# Load registry.py as a module
-registry_file = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'registry.py')
-spec = importlib.util.spec_from_file_location("tools_registry", registry_file)
-registry_module = importlib.util.module_from_spec(spec)
-spec.loader.exec_module(registry_module)
+# Load registry.py as a module, once, so the loaders share the same TOOL_REGISTRY
+registry_module = sys.modules.get("tools_registry")
+if registry_module is None:
+    registry_file = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'registry.py')
+    spec = importlib.util.spec_from_file_location("tools_registry", registry_file)
+    registry_module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(registry_module)
+    sys.modules["tools_registry"] = registry_module
 
 # Extract the needed items
 TOOL_REGISTRY = registry_module.TOOL_REGISTRY
 TOOL_CATEGORIES = registry_module.TOOL_CATEGORIES
 get_tool_descriptions_for_prompt = registry_module.get_tool_descriptions_for_prompt
+get_registry_version = registry_module.get_registry_version
+register_tool = registry_module.register_tool
+unregister_tool = registry_module.unregister_tool
 get_tools_by_category = registry_module.get_tools_by_category
+get_category_index = registry_module.get_category_index
 CONTEXT_HINTS = registry_module.CONTEXT_HINTS
 
 # Now import the loaders
@@ -25,6 +33,10 @@ __all__ = [
     'TOOL_REGISTRY',
     'TOOL_CATEGORIES',
     'get_tool_descriptions_for_prompt',
+    'get_registry_version',
+    'register_tool',
+    'unregister_tool',
     'get_tools_by_category',
+    'get_category_index',
     'CONTEXT_HINTS'
 ]
\ No newline at end of file
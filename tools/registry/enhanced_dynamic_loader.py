@@ -7,19 +7,26 @@ import logging
 import os
 import sys
 
+import orjson
+
 from tools.mcp_client import MCPClient, RemoteTool
 
 # Import from the registry.py file to avoid circular imports
 import importlib.util
 
-registry_file = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'registry.py')
-spec = importlib.util.spec_from_file_location("tools_registry", registry_file)
-registry_module = importlib.util.module_from_spec(spec)
-spec.loader.exec_module(registry_module)
+# Reuse the module if tools.registry already loaded it, so both share one TOOL_REGISTRY
+registry_module = sys.modules.get("tools_registry")
+if registry_module is None:
+    registry_file = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'registry.py')
+    spec = importlib.util.spec_from_file_location("tools_registry", registry_file)
+    registry_module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(registry_module)
+    sys.modules["tools_registry"] = registry_module
 
 TOOL_REGISTRY = registry_module.TOOL_REGISTRY
 TOOL_CATEGORIES = registry_module.TOOL_CATEGORIES
 get_tools_by_category = registry_module.get_tools_by_category
+get_registry_version = registry_module.get_registry_version
 
 logger = logging.getLogger(__name__)
 
@@ -30,11 +37,14 @@ class EnhancedDynamicToolRegistry:
         self.manifest_path = manifest_path or Path(__file__).parent / "tool_manifest.yaml"
         self.manifest = self.load_manifest()
         self.tool_cache = {}
+        self.metadata_cache = {}
+        self.serialized_metadata_cache = {}
         self.mcp_connections = {}
         self.connection_lock = asyncio.Lock()
         
         # Map registry keys to actual tool IDs
         self.registry_to_tool_id = self._build_registry_mapping()
+        self.registry_version = get_registry_version()
     
     def load_manifest(self) -> Dict[str, Any]:
         """Load tool manifest from YAML file."""
@@ -104,6 +114,55 @@ class EnhancedDynamicToolRegistry:
             if server_name not in self.mcp_connections:
                 self.mcp_connections[server_name] = await self._connect_mcp(server_name)
         
+        enhanced_metadata = self._get_tool_metadata(tool_id)
+        
+        # Create remote tool wrapper
+        tool = RemoteTool(
+            tool_id=tool_id,
+            connection=self.mcp_connections[server_name],
+            metadata=enhanced_metadata
+        )
+        
+        # Cache the tool
+        self.tool_cache[tool_id] = tool
+        
+        return tool
+    
+    def get_metadata(self, tool_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Get tool descriptors without loading the tools or connecting to their servers."""
+        self._sync_registry_version()
+        result = {}
+        for tool_id in tool_ids:
+            if tool_id in self.manifest["tools"]:
+                result[tool_id] = self._get_tool_metadata(tool_id)
+            else:
+                logger.warning(f"Tool {tool_id} not found in manifest")
+        return result
+    
+    def get_serialized_metadata(self, tool_ids: Tuple[str, ...]) -> str:
+        """Get the tool descriptors as a JSON string, serialized once per registry version."""
+        self._sync_registry_version()
+        if tool_ids not in self.serialized_metadata_cache:
+            metadata = self.get_metadata(list(tool_ids))
+            self.serialized_metadata_cache[tool_ids] = orjson.dumps(list(metadata.values())).decode()
+        return self.serialized_metadata_cache[tool_ids]
+    
+    def _sync_registry_version(self):
+        """Drop derived metadata if tools were registered or removed since it was built."""
+        version = get_registry_version()
+        if version != self.registry_version:
+            self.registry_to_tool_id = self._build_registry_mapping()
+            self.metadata_cache.clear()
+            self.serialized_metadata_cache.clear()
+            self.registry_version = version
+    
+    def _get_tool_metadata(self, tool_id: str) -> Dict[str, Any]:
+        """Merge manifest and registry metadata for a tool, caching the result."""
+        if tool_id in self.metadata_cache:
+            return self.metadata_cache[tool_id]
+        
+        tool_info = self.manifest["tools"][tool_id]
+        
         # Find registry info for enhanced metadata
         registry_info = None
         for key, info in TOOL_REGISTRY.items():
@@ -119,17 +178,8 @@ class EnhancedDynamicToolRegistry:
             "examples": registry_info.get("examples") if registry_info else None
         }
         
-        # Create remote tool wrapper
-        tool = RemoteTool(
-            tool_id=tool_id,
-            connection=self.mcp_connections[server_name],
-            metadata=enhanced_metadata
-        )
-        
-        # Cache the tool
-        self.tool_cache[tool_id] = tool
-        
-        return tool
+        self.metadata_cache[tool_id] = enhanced_metadata
+        return enhanced_metadata
     
     async def _connect_mcp(self, server_name: str) -> MCPClient:
         """Connect to an MCP server."""
@@ -247,6 +297,8 @@ class EnhancedDynamicToolRegistry:
             await connection.disconnect()
         self.mcp_connections.clear()
         self.tool_cache.clear()
+        self.metadata_cache.clear()
+        self.serialized_metadata_cache.clear()
 
 # Utility functions for migration
 def map_old_tool_id_to_registry_key(tool_id: str) -> Optional[str]:
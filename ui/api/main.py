@@ -1,6 +1,7 @@
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+import asyncio
 import uuid
 import json
 import logging
@@ -8,6 +9,7 @@ import os
 
 from agent.enhanced_genesis_agent import EnhancedGenesisAgent
 from agent.enhanced_context_manager import EnhancedContextManager
+from agent.client_context import ClientContext
 from ui.api.models import ChatRequest, ChatResponse
 
 logging.basicConfig(level=logging.DEBUG)
@@ -21,13 +23,17 @@ context_manager = None
 async def lifespan(app: FastAPI):
     # Startup
     global agent, context_manager
-    agent = EnhancedGenesisAgent(llm_provider=os.getenv("LLM_PROVIDER", "openai"))
-    context_manager = EnhancedContextManager()
-    logger.info("Genesis Agent initialized")
-    yield
-    # Shutdown
-    if hasattr(agent.tool_registry, 'cleanup'):
-        await agent.tool_registry.cleanup()
+    async with ClientContext():
+        agent = EnhancedGenesisAgent(llm_provider=os.getenv("LLM_PROVIDER", "openai"))
+        context_manager = EnhancedContextManager()
+        # Tool connections are opened in the background so startup is not held up by them
+        warmup = asyncio.create_task(agent.warmup())
+        logger.info("Genesis Agent initialized")
+        yield
+        # Shutdown
+        warmup.cancel()
+        if hasattr(agent.tool_registry, 'cleanup'):
+            await agent.tool_registry.cleanup()
 
 app = FastAPI(title="Genesis Agent API", lifespan=lifespan)
 
@@ -95,5 +101,7 @@ async def websocket_chat(websocket: WebSocket):
         })
 
 if __name__ == "__main__":
+    import sys
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # uvloop is required everywhere but Windows; asking for it fails loudly if it is missing
+    uvicorn.run(app, host="0.0.0.0", port=8000, loop="asyncio" if sys.platform == "win32" else "uvloop")
\ No newline at end of file